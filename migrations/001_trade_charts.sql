@@ -0,0 +1,18 @@
+-- Rendered chart per trade and timeframe, written by store_rendered_charts().
+-- Apply in the Supabase SQL editor (or psql) before deploying.
+--
+-- The unique index backs upsert(..., on_conflict="trade_id,timeframe").
+
+create table if not exists public.trade_charts (
+    id          bigint generated by default as identity primary key,
+    trade_id    bigint      not null references public.trades (id) on delete cascade,
+    timeframe   text        not null,
+    chart_image text,
+    created_at  timestamptz not null default now()
+);
+
+create unique index if not exists trade_charts_trade_id_timeframe_key
+    on public.trade_charts (trade_id, timeframe);
+
+-- Only the server (service role) reads and writes chart rows
+alter table public.trade_charts enable row level security;
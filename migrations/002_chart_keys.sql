@@ -0,0 +1,11 @@
+-- Chart images move to the content-addressed blob store (utils/blobs.py);
+-- rows only keep the sha256 key. chart_image stays for charts stored inline
+-- before this change. /api/trades selects trades.chart_key by default, so
+-- apply this before deploying.
+
+alter table public.trades       add column if not exists chart_key text;
+alter table public.trade_charts add column if not exists chart_key text;
+
+-- user_owns_chart() looks charts up by key
+create index if not exists trades_chart_key_idx       on public.trades (chart_key);
+create index if not exists trade_charts_chart_key_idx on public.trade_charts (chart_key);
@@ -0,0 +1,5 @@
+-- What each stored chart was drawn from: the hex sha256 returned by
+-- utils.charts.render_fingerprint(). run_generate_charts_job skips
+-- timeframes whose fingerprint is unchanged.
+
+alter table public.trade_charts add column if not exists fingerprint text;
@@ -1,26 +1,112 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 from functools import wraps
 from datetime import datetime, timedelta
-from utils.functions import csv_handler, filter_trades
+from utils.functions import CSV_COLUMNS, csv_handler, apply_trade_filters
+from utils.analytics import compute_analytics, tag_mask
+from utils.blobs import BlobStore
+from utils.brokers import ExportParser, expand_uploads, read_csv_chunks, UnsupportedFormat
+from utils.cache import TTLCache
+from utils.candles import SYMBOL_PATTERN, CandleStore, settled, to_yahoo_payload
+from utils.charts import YAHOO_INTERVALS, ChartEngine, TradeChart, candle_windows, parse_timeframes, render_fingerprint, timeframe_seconds
+from utils.jobs import JobQueue
+from utils.images import IMAGE_VARIANTS, VariantStore
+from utils.grouping import auto_group, trade_aggregates, fill_hashes, duplicate_fills
+from utils.staging import StagingStore
+from utils.summary import DailySummary, trade_deltas
+from utils.pagination import PAGE_SIZE, chunked, fetch_all, fetch_in, fetch_page, insert_all, encode_cursor, decode_cursor
+from utils.yahoo import fetch_chart, yahoo_symbol as yahoo_symbol_for, YahooError
 from zoneinfo import ZoneInfo
 import os
-import io, base64
+import base64, hashlib
+import numpy as np
 import pandas as pd
 from supabase import create_client, Client
-import requests
-import mplfinance as mpf
-import matplotlib.pyplot as plt
+from werkzeug.exceptions import RequestEntityTooLarge
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "change-me-in-production")
 
 # ===== CONFIG =====
 UPLOAD_FOLDER = "imported_data"
-ALLOWED_EXTENSIONS = {"csv"}
+CANDLE_FOLDER = os.environ.get("CANDLE_FOLDER", "candle_data")
+JOBS_FOLDER   = os.environ.get("JOBS_FOLDER", "job_data")
+SUMMARY_DB    = os.environ.get("SUMMARY_DB", "summary_data/daily_pnl.sqlite3")
+STAGING_FOLDER = os.environ.get("STAGING_FOLDER", os.path.join(UPLOAD_FOLDER, "staging"))
+BLOB_FOLDER   = os.environ.get("BLOB_FOLDER", "chart_data/blobs")
+VARIANT_FOLDER = os.environ.get("VARIANT_FOLDER", "chart_data/variants")
+ALLOWED_EXTENSIONS = {"csv", "zip"}
+
+# Fills per /upload/preview page
+PREVIEW_ROWS = 5000
+
+# Columns /api/trades returns by default: everything but the legacy inline
+# chart image; charts are served on their own by key from /api/charts/<key>
+TRADE_COLUMNS = [
+    "id", "symbol", "side", "qty",
+    "entryTimestamp", "exitTimestamp", "entryPrice", "exitPrice", "duration",
+    "pnl", "gross_pnl", "fees", "notes",
+    "key_trading_accounts", "key_strategies_id", "chart_key",
+]
+TRADE_FIELDS = set(TRADE_COLUMNS) | {"chart_image", "has_chart"}
 
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Whole request body, uploads included; larger ones get a 413
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", 100)) * 1024 * 1024
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# ===== MARKET DATA =====
+candle_store = CandleStore(CANDLE_FOLDER)
+chart_engine = ChartEngine(candle_store, max_workers=int(os.environ.get("CHART_WORKERS", 0)) or None)
+
+# Serialised /api/yahoo responses: settled days never change, live ranges only briefly
+yahoo_cache    = TTLCache(maxsize=int(os.environ.get("YAHOO_CACHE_SIZE", 512)))
+YAHOO_LIVE_TTL = 30
+
+# Settings rows by user_id. update_settings drops this process's entry on
+# every write; the TTL bounds how long other workers can serve an old row.
+settings_cache = TTLCache(
+    maxsize=int(os.environ.get("SETTINGS_CACHE_SIZE", 1024)),
+    ttl=int(os.environ.get("SETTINGS_CACHE_TTL", 300)),
+)
+
+# Per-account index of imported fills: (fill_hashes() array, highest fills.id).
+# Uploads only fetch the fills added above that id; deleting or moving trades
+# drops this process's entry, the TTL bounds how long other workers keep one.
+fill_key_cache = TTLCache(
+    maxsize=int(os.environ.get("FILL_KEY_CACHE_SIZE", 64)),
+    ttl=int(os.environ.get("FILL_KEY_CACHE_TTL", 3600)),
+)
+
+# ===== CHART IMAGES (content-addressed, trades only keep the key) =====
+blob_store = BlobStore(BLOB_FOLDER)
+# A blob put() this recently is never collected: the row naming it may still be on its way
+CHART_GC_GRACE = int(os.environ.get("CHART_GC_GRACE", 300))
+
+# (user_id, chart key) pairs known to be owned, so lazy thumbnails skip the
+# ownership queries. Filled by /api/trades and the chart redirects; the TTL
+# bounds how long a deleted trade's images stay reachable from other workers.
+chart_owner_cache = TTLCache(
+    maxsize=int(os.environ.get("CHART_OWNER_CACHE_SIZE", 8192)),
+    ttl=int(os.environ.get("CHART_OWNER_CACHE_TTL", 300)),
+)
+
+# Grid thumbnails and overlay images, re-encoded from the stored PNGs
+chart_variants = VariantStore(
+    blob_store, VARIANT_FOLDER,
+    fmt=os.environ.get("CHART_IMAGE_FORMAT", "webp"),
+    quality=int(os.environ.get("CHART_IMAGE_QUALITY", 80)),
+)
+
+# ===== BACKGROUND JOBS =====
+job_queue = JobQueue(JOBS_FOLDER)
+
+# ===== UPLOAD STAGING =====
+staging_store = StagingStore(STAGING_FOLDER)
+export_parser = ExportParser(max_workers=int(os.environ.get("IMPORT_WORKERS", 0)) or None)
+
+# ===== DAILY P&L SUMMARY =====
+daily_summary = DailySummary(SUMMARY_DB)
+
 # ===== SUPABASE =====
 SUPABASE_URL         = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY         = os.environ.get("SUPABASE_KEY")
@@ -35,21 +121,28 @@ def allowed_file(filename):
 
 
 def load_user_settings_into_session(user_id):
-    res = (
-        supabase_admin.table("settings")
-        .select("*")
-        .eq("user_id", user_id)
-        .execute()
-    )
-
-    if res.data:
-        settings = res.data[0]
+    settings = get_user_settings(user_id)
+    if settings:
         session["timezone"] = settings.get("timezone", "Europe/Paris")
         session["settings"] = settings
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_user_settings(user_id):
+    """Return the user's settings row (timezone, MA/VWAP chart settings), or {}."""
+    settings = settings_cache.get(user_id)
+    if settings is None:
+        res = (
+            supabase_admin.table("settings")
+            .select("*")
+            .eq("user_id", user_id)
+            .execute()
+        )
+        settings = res.data[0] if res.data else {}
+        settings_cache.set(user_id, settings)
+    return dict(settings)
+
 def get_user_trade_ids(user_id):
     """Return all trade IDs belonging to the current user."""
     accounts_res = (
@@ -61,13 +154,51 @@ def get_user_trade_ids(user_id):
     account_ids = [a["id"] for a in (accounts_res.data or [])]
     if not account_ids:
         return []
-    trades_res = (
-        supabase_admin.table("trades")
+    trades = fetch_all(
+        lambda: supabase_admin.table("trades")
         .select("id")
         .in_("key_trading_accounts", account_ids)
-        .execute()
     )
-    return [t["id"] for t in (trades_res.data or [])]
+    return [t["id"] for t in trades]
+
+def account_fill_keys(account_id, after=None):
+    """
+    (fill_hashes() array, highest fills.id) of the fills already imported
+    into an account, or only of those with an id above `after`: one
+    paginated query of fills joined to their trades.
+    """
+    def build():
+        query = (
+            supabase_admin.table("fills")
+            .select("id, buy_fill_id, sell_fill_id, trades!inner(key_trading_accounts)")
+            .eq("trades.key_trading_accounts", account_id)
+        )
+        return query.gt("id", after) if after is not None else query
+
+    fills = fetch_all(build)
+    keys  = fill_hashes([f["buy_fill_id"] for f in fills], [f["sell_fill_id"] for f in fills])
+    return keys, max((f["id"] for f in fills), default=after)
+
+def imported_fill_keys(account_id):
+    """account_fill_keys() of a whole account, from the cached index topped up with only the newer fills."""
+    account_id = int(account_id)
+    cached     = fill_key_cache.get(account_id)
+    if cached is None:
+        keys, last = account_fill_keys(account_id)
+    else:
+        keys, last   = cached
+        recent, last = account_fill_keys(account_id, after=last)
+        keys         = np.concatenate([keys, recent])
+    fill_key_cache.set(account_id, (keys, last))
+    return keys, last
+
+def load_account_trades_for_summary(account_id):
+    """The columns DailySummary needs, for every trade of one account."""
+    return fetch_all(
+        lambda: supabase_admin.table("trades")
+        .select("id, key_trading_accounts, entryTimestamp, pnl")
+        .eq("key_trading_accounts", account_id)
+    )
 
 # ===== AUTH =====
 def login_required(f):
@@ -233,295 +364,6 @@ def logout():
     session.clear()
     return redirect(url_for("login"))
 
-# ===== CHART GENERATION =====
-def generate_chart_base64(symbol, entry_time, exit_time, entry_price, exit_price, side, user_id, timeframe="5m", fills=None):
-    try:
-        # ── Timeframe → Yahoo interval mapping ──────────────────────────
-        TIMEFRAME_TO_YAHOO = {
-            "1m": "1m", "2m": "2m", "3m": "2m",
-            "5m": "5m", "15m": "15m", "30m": "30m",
-            "1h": "60m", "4h": "60m", "D": "1d",
-        }
-        YAHOO_LOOKBACK_DAYS = {
-            "1m": 1, "2m": 5, "5m": 5,
-            "15m": 10, "30m": 15, "60m": 30, "1d": 90,
-        }
-        CONTEXT_HOURS = {
-            "1m":  (2, 3),   "2m":  (2, 3),   "3m":  (3, 4),
-            "5m":  (4, 5),   "15m": (8, 10),   "30m": (16, 20),
-            "1h":  (24, 48), "4h":  (72, 120), "D":   (720, 1440),
-        }
-        yahoo_interval        = TIMEFRAME_TO_YAHOO.get(timeframe, "5m")
-        lookback              = YAHOO_LOOKBACK_DAYS.get(yahoo_interval, 5)
-        ctx_before, ctx_after = CONTEXT_HOURS.get(timeframe, (3, 4))
-
-        yahoo_symbol = symbol if symbol.endswith("=F") else f"{symbol}=F"
-        trade_date   = entry_time.date()
-
-        period1 = int((datetime.combine(trade_date, datetime.min.time()) - timedelta(days=lookback)).timestamp())
-        period2 = int((datetime.combine(trade_date, datetime.min.time()) + timedelta(days=2)).timestamp())
-
-        url = (
-            f"https://query1.finance.yahoo.com/v8/finance/chart/{yahoo_symbol}"
-            f"?interval={yahoo_interval}&period1={period1}&period2={period2}"
-        )
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept":     "application/json",
-            "Referer":    "https://finance.yahoo.com",
-        }
-
-        r = requests.get(url, headers=headers, timeout=10)
-        if not r.ok:
-            print(f"Yahoo returned {r.status_code} for {yahoo_symbol}: {r.text[:300]}")
-            return None
-
-        data   = r.json()
-        result = data.get("chart", {}).get("result")
-        if not result:
-            print(f"No result in Yahoo response for {yahoo_symbol}: {data.get('chart', {}).get('error')}")
-            return None
-
-        result     = result[0]
-        timestamps = result["timestamp"]
-        quote      = result["indicators"]["quote"][0]
-
-        settings_res = (
-            supabase_admin.table("settings")
-            .select("*")
-            .eq("user_id", user_id)
-            .execute()
-        )
-        settings = settings_res.data[0] if settings_res.data else {}
-
-        user_timezone = settings.get("timezone", "Europe/Paris")
-
-        df = pd.DataFrame({
-            "Open":   quote["open"],
-            "High":   quote["high"],
-            "Low":    quote["low"],
-            "Close":  quote["close"],
-            "Volume": quote.get("volume", [0] * len(timestamps))
-        }, index=pd.to_datetime(timestamps, unit="s", utc=True).tz_convert(user_timezone))
-
-        df = df.dropna(subset=["Open", "High", "Low", "Close"])
-
-        if len(df) < 5:
-            print(f"Insufficient candles for {yahoo_symbol}: {len(df)}")
-            return None
-
-        # ── Localize trade-level entry/exit (used for chart window) ─────
-        entry_ts = pd.Timestamp(entry_time)
-        exit_ts  = pd.Timestamp(exit_time)
-
-        if entry_ts.tzinfo is None:
-            entry_ts = entry_ts.tz_localize(user_timezone)
-        else:
-            entry_ts = entry_ts.tz_convert(user_timezone)
-
-        if exit_ts.tzinfo is None:
-            exit_ts = exit_ts.tz_localize(user_timezone)
-        else:
-            exit_ts = exit_ts.tz_convert(user_timezone)
-
-        def to_bool(v):
-            return v in [True, "true", "True", 1, "1"]
-
-        def to_int(v):
-            try:
-                return int(float(v)) if v is not None else None
-            except:
-                return None
-
-        MA_TYPE_MAP = {1: "SMA", 2: "EMA"}
-
-        # ── 1. Compute MAs on FULL df (needs max history) ───────────────
-        ma_configs = [
-            {"enabled": to_bool(settings.get("MA1_activ")), "type": to_int(settings.get("MA1_type")), "value": to_int(settings.get("MA1_value"))},
-            {"enabled": to_bool(settings.get("MA2_activ")), "type": to_int(settings.get("MA2_type")), "value": to_int(settings.get("MA2_value"))},
-        ]
-
-        for ma in ma_configs:
-            if not ma["enabled"] or not ma["value"] or ma["value"] <= 0:
-                continue
-            ma_type     = MA_TYPE_MAP.get(ma["type"], "EMA")
-            column_name = f"{ma_type}_{ma['value']}"
-            if ma_type == "SMA":
-                df[column_name] = df["Close"].rolling(ma["value"]).mean()
-            else:
-                df[column_name] = df["Close"].ewm(span=ma["value"], adjust=False).mean()
-
-        # ── 2. Compute VWAP on FULL df ───────────────────────────────────
-        if to_bool(settings.get("VWAP_activ")):
-            typical_price     = (df["High"] + df["Low"] + df["Close"]) / 3
-            df["_tp_vol"]     = typical_price * df["Volume"]
-            df["_date"]       = df.index.date
-            df["_cum_tp_vol"] = df.groupby("_date")["_tp_vol"].cumsum()
-            df["_cum_vol"]    = df.groupby("_date")["Volume"].cumsum().replace(0, float("nan"))
-            df["VWAP"]        = (df["_cum_tp_vol"] / df["_cum_vol"]).ffill()
-            df.drop(columns=["_tp_vol", "_date", "_cum_tp_vol", "_cum_vol"], inplace=True)
-
-        # ── 3. Trim to trade window ──────────────────────────────────────
-        df = df[
-            (df.index >= entry_ts - timedelta(hours=ctx_before)) &
-            (df.index <= exit_ts  + timedelta(hours=ctx_after))
-        ]
-
-        if df.empty or len(df) < 5:
-            print(f"No candles in trade window for {yahoo_symbol}")
-            return None
-
-        is_long     = str(side).lower() == "long"
-        entry_color = "#26a666" if is_long else "#ef5350"
-        exit_color  = "#ef5350" if is_long else "#26a666"
-
-        # ── 4. Build addplots AFTER trim ─────────────────────────────────
-        apds = []
-
-        for ma in ma_configs:
-            if not ma["enabled"] or not ma["value"] or ma["value"] <= 0:
-                continue
-            col = f"{MA_TYPE_MAP.get(ma['type'], 'EMA')}_{ma['value']}"
-            if col in df.columns:
-                apds.append(mpf.make_addplot(df[col], width=1.2))
-
-        if "VWAP" in df.columns:
-            apds.append(mpf.make_addplot(df["VWAP"], width=1.2, color="#d47bfd"))
-
-        # ── 5. Per-fill markers ──────────────────────────────────────────
-        # Collect all entry/exit prices for hlines
-        all_entry_prices = set()
-        all_exit_prices  = set()
-
-        def parse_fill_ts(raw):
-            ts = pd.Timestamp(str(raw).split(".")[0])  # strip microseconds, treat as naive local time
-            if ts.tzinfo is None:
-                ts = ts.tz_localize(user_timezone)
-            else:
-                ts = ts.tz_convert(user_timezone)
-            return ts
-
-        if fills:
-            for fill in fills:
-                try:
-                    # Resolve which timestamp/price is entry vs exit per side
-                    if is_long:
-                        fe_ts = parse_fill_ts(fill["bought_timestamp"])
-                        fx_ts = parse_fill_ts(fill["sold_timestamp"])
-                        fe_px = float(fill["buy_price"])
-                        fx_px = float(fill["sell_price"])
-                    else:
-                        fe_ts = parse_fill_ts(fill["sold_timestamp"])
-                        fx_ts = parse_fill_ts(fill["bought_timestamp"])
-                        fe_px = float(fill["sell_price"])
-                        fx_px = float(fill["buy_price"])
-
-                    fe_idx = df.index.get_indexer([fe_ts], method="nearest")[0]
-                    fx_idx = df.index.get_indexer([fx_ts], method="nearest")[0]
-
-                    # Entry marker
-                    apds.append(mpf.make_addplot(
-                        [fe_px if i == fe_idx else float("nan") for i in range(len(df))],
-                        type="scatter", markersize=90,
-                        marker="^" if is_long else "v", color=entry_color
-                    ))
-                    # Exit marker
-                    apds.append(mpf.make_addplot(
-                        [fx_px if i == fx_idx else float("nan") for i in range(len(df))],
-                        type="scatter", markersize=90,
-                        marker="v" if is_long else "^", color=exit_color
-                    ))
-
-                    all_entry_prices.add(fe_px)
-                    all_exit_prices.add(fx_px)
-
-                except Exception as e:
-                    print(f"Marker error for fill: {e}")
-                    continue
-
-        else:
-            # ── Fallback: single marker for legacy trades without fills ──
-            entry_idx = df.index.get_indexer([entry_ts], method="nearest")[0]
-            exit_idx  = df.index.get_indexer([exit_ts],  method="nearest")[0]
-
-            apds.append(mpf.make_addplot(
-                [entry_price if i == entry_idx else float("nan") for i in range(len(df))],
-                type="scatter", markersize=120,
-                marker="^" if is_long else "v", color=entry_color
-            ))
-            apds.append(mpf.make_addplot(
-                [exit_price if i == exit_idx else float("nan") for i in range(len(df))],
-                type="scatter", markersize=120,
-                marker="v" if is_long else "^", color=exit_color
-            ))
-
-            all_entry_prices.add(entry_price)
-            all_exit_prices.add(exit_price)
-
-        # ── 6. Hlines: one per unique price level ────────────────────────
-        hline_prices = list(all_entry_prices) + list(all_exit_prices)
-        hline_colors = [entry_color] * len(all_entry_prices) + [exit_color] * len(all_exit_prices)
-
-        hlines = dict(
-            hlines=hline_prices,
-            colors=hline_colors,
-            linestyle="--", linewidths=0.8
-        )
-
-        # ── 7. Custom candle style ───────────────────────────────────────
-        custom_style = mpf.make_mpf_style(
-            base_mpf_style="charles",
-            marketcolors=mpf.make_marketcolors(
-                up   = "#D1D1D1",
-                down = "#7E838C",
-                edge = {"up": "#7E838C", "down": "#7E838C"},
-                wick = {"up": "#7E838C", "down": "#7E838C"},
-                ohlc = "inherit",
-                volume = {"up": "#D1D1D1", "down": "#7E838C"},
-            ),
-            facecolor = "#ffffff",
-            figcolor  = "#ffffff",
-            gridcolor = "#e0e0e0",
-            gridstyle = "--",
-            gridaxis  = "both",
-        )
-
-        fig, axes = mpf.plot(
-            df,
-            type="candle",
-            style=custom_style,
-            addplot=apds,
-            hlines=hlines,
-            tight_layout=True,
-            figsize=(10, 5),
-            returnfig=True
-        )
-
-        # ── 8. Watermark ─────────────────────────────────────────────────
-        axes[0].text(
-            0.02, 0.02,
-            timeframe,
-            transform=axes[0].transAxes,
-            fontsize=18,
-            color="#b0b0b0",
-            alpha=0.6,
-            ha="left",
-            va="bottom",
-            fontweight="bold"
-        )
-
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png", dpi=100)
-        plt.close(fig)
-        buf.seek(0)
-        return base64.b64encode(buf.read()).decode("utf-8")
-
-    except Exception as e:
-        import traceback
-        print(f"Chart generation failed for {symbol}")
-        print(traceback.format_exc())
-        return None
 # ===== PAGE ROUTES =====
 @app.get("/api/fills/<int:trade_id>")
 @login_required
@@ -574,24 +416,30 @@ def journal():
 def charts():
     return render_template("charts.html")
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    # the upload page reads every answer as JSON
+    return jsonify({"error": f"Upload too large (max {app.config['MAX_CONTENT_LENGTH'] >> 20} MB)"}), 413
+
 @app.route("/upload", methods=["GET", "POST"])
 @login_required
 def upload_file():
     if request.method == "GET":
         return render_template("upload.html")
     try:
-        if "file" not in request.files:
+        # one CSV, several CSVs, or zip archives of them
+        files = [f for f in request.files.getlist("file") if f.filename]
+        if not files:
             return jsonify({"error": "No file provided"}), 400
 
-        file = request.files["file"]
-        if not file.filename.lower().endswith(".csv"):
-            return jsonify({"error": "Only CSV files allowed"}), 400
-
         account_id = request.form.get("account_id")
         if not account_id:
             return jsonify({"error": "No account selected"}), 400
 
-        df = pd.read_csv(file)
+        try:
+            chart_timeframes = parse_timeframes(request.form.get("chart_timeframe", "5m"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         user_id = session["user"]["id"]
         fees_res = (
@@ -602,165 +450,231 @@ def upload_file():
         )
         df_fees = pd.DataFrame(fees_res.data or [])
 
-        df_fills = csv_handler(df, df_fees)
-
-        # tag each fill with account_id for later use in confirm
-        df_fills["key_trading_accounts"] = account_id
-
-        session["preview_fills"]  = df_fills.to_dict(orient="records")
-        session["chart_timeframe"] = request.form.get("chart_timeframe", "5m")
+        # a single CSV is streamed chunk by chunk; several files (or zip
+        # members) are parsed in parallel worker processes
+        if len(files) == 1 and files[0].filename.lower().endswith(".csv"):
+            parsed = (csv_handler(chunk, df_fees) for chunk in read_csv_chunks(files[0].stream))
+        else:
+            parsed = export_parser.parse_many(expand_uploads(files), df_fees)
+
+        # the account's fills, looked up once; confirm reuses them and only
+        # checks what was imported after `fills_after`
+        imported, fills_after = imported_fill_keys(account_id)
+
+        # each normalised chunk is deduped and staged on disk as it arrives, the
+        # session only carries the token; grouping only keeps a compact
+        # projection of every fill, since a trade can span chunks
+        upload   = staging_store.open(user_id, chart_timeframes=chart_timeframes, fills_after=fills_after)
+        seen     = np.empty(0, dtype=np.uint64)
+        symbols  = {}
+        grouping = []
+        skipped  = 0
+        try:
+            for df_fills in parsed:
+
+                # drop fills this account already has (or that repeat within the file)
+                dup = duplicate_fills(df_fills, imported, seen)
+                seen = np.concatenate([seen, fill_hashes(df_fills["buyFillId"][~dup], df_fills["sellFillId"][~dup])])
+                skipped += int(dup.sum())
+                df_fills = df_fills[~dup].copy()
+
+                # tag each fill with account_id for later use in confirm
+                df_fills["key_trading_accounts"] = account_id
+                upload.append(df_fills)
+
+                codes = {s: symbols.setdefault(s, len(symbols)) for s in df_fills["symbol"].unique()}
+                grouping.append(pd.DataFrame({
+                    "key_trading_accounts": 0,
+                    "symbol":               df_fills["symbol"].map(codes).to_numpy(np.int32),
+                    "qty":                  df_fills["qty"].to_numpy(),
+                    "buyPrice":             df_fills["buyPrice"].to_numpy(float),
+                    "sellPrice":            df_fills["sellPrice"].to_numpy(float),
+                    "boughtTimestamp":      pd.to_datetime(df_fills["boughtTimestamp"]).to_numpy("datetime64[s]"),
+                    "soldTimestamp":        pd.to_datetime(df_fills["soldTimestamp"]).to_numpy("datetime64[s]"),
+                }))
+
+            if not upload.rows:
+                upload.abort()
+                if skipped:
+                    return jsonify({"error": f"All {skipped} fills were already imported"}), 400
+                return jsonify({"error": "No fills found in CSV"}), 400
+
+            # ready-made trades: fills grouped until the position is flat again
+            group_ids = auto_group(pd.concat(grouping, ignore_index=True))
+            del grouping
+            upload.attach("fill_keys", imported)
+            upload.attach("group_ids", group_ids)
+        except Exception:
+            upload.abort()
+            raise
 
-        # send preview without account_id column
-        preview = df_fills.drop(columns=["key_trading_accounts", "fees"])
+        staging_store.discard(session.get("upload_token"))
+        session["upload_token"] = upload.commit()
 
+        # the rest of the preview is fetched page by page from /upload/preview
+        page = preview_page(user_id, session["upload_token"], 0)
         return jsonify({
-            "rows":    preview.to_dict(orient="records"),
-            "columns": list(preview.columns)
+            **page,
+            "columns": list(CSV_COLUMNS),
+            "trades":  int(group_ids.max()) + 1,
+            "skipped": skipped,
         })
 
+    except UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 400
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def preview_page(user_id, token, offset):
+    """One PREVIEW_ROWS page of a staged upload's fills with their group ids, or None."""
+    staged = staging_store.page(user_id, token, offset, PREVIEW_ROWS)
+    if staged is None:
+        return None
+    frame, total = staged
+    group_ids    = staging_store.attachment(user_id, token, "group_ids")
+    end          = offset + len(frame)
+    return {
+        # send preview without account_id column
+        "rows":      frame.drop(columns=["key_trading_accounts", "fees"], errors="ignore").to_dict(orient="records"),
+        "group_ids": group_ids[offset:end].tolist(),
+        "offset":    offset,
+        "total":     total,
+        "next":      end if end < total else None,
+    }
+
+@app.get("/upload/preview")
+@login_required
+def upload_preview():
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except ValueError:
+        return jsonify({"error": "Invalid offset"}), 400
+    page = preview_page(session["user"]["id"], session.get("upload_token"), offset)
+    if page is None:
+        return jsonify({"error": "No fills in session"}), 400
+    return jsonify(page)
+
+def trade_identity(trade):
+    """What tells an inserted trade apart from the others of its import, as sent or as returned."""
+    return (
+        int(trade["key_trading_accounts"]),
+        trade["symbol"],
+        trade["side"],
+        str(trade["entryTimestamp"]).replace("T", " ")[:19],
+        str(trade["exitTimestamp"]).replace("T", " ")[:19],
+        float(trade["qty"]),
+    )
+
 @app.route("/confirm_upload", methods=["POST"])
 @login_required
 def confirm_upload():
     try:
-        data   = request.json
-        # groups: [{ fillIndices: [0,2,3], label: "Trade 1" }, ...]
-        groups = data.get("groups", [])
-        fills  = session.get("preview_fills", [])
+        data   = request.json or {}
+        # groups (optional): [{ fillIndices: [0,2,3], label: "Trade 1" }, ...]
+        # without them the server grouping from the preview is used, minus `exclude`
+        groups  = data.get("groups")
+        exclude = {int(g) for g in data.get("exclude", [])}
 
-        if not fills:
+        user_id = session["user"]["id"]
+        staged  = staging_store.get(user_id, session.get("upload_token"))
+        if staged is None or staged[0].empty:
             return jsonify({"error": "No fills in session"}), 400
-        if not groups:
+        df_fills, meta = staged
+
+        # another import may have landed since the preview: never insert a fill twice
+        imported = staging_store.attachment(user_id, session.get("upload_token"), "fill_keys", np.empty(0, dtype=np.uint64))
+        already  = np.zeros(len(df_fills), dtype=bool)
+        for account_id, idx in df_fills.groupby("key_trading_accounts").indices.items():
+            recent, _    = account_fill_keys(account_id, after=meta.get("fills_after"))
+            already[idx] = duplicate_fills(df_fills.iloc[idx], imported, recent)
+
+        if groups is None:
+            group_ids = auto_group(df_fills)
+            group_ids[np.isin(group_ids, list(exclude))] = -1
+        else:
+            group_ids = np.full(len(df_fills), -1, dtype=np.int64)
+            for g, group in enumerate(groups):
+                indices = [i for i in group.get("fillIndices", []) if 0 <= i < len(df_fills)]
+                group_ids[indices] = g
+        group_ids[already] = -1
+        if not (group_ids >= 0).any():
+            if already.any():
+                return jsonify({"error": "These fills were already imported"}), 400
             return jsonify({"error": "No groups defined"}), 400
 
-        user_id        = session["user"]["id"]
-        chart_timeframe = session.get("chart_timeframe", "5m")
-        failed_charts  = []
-        inserted_trades = []
-
-        for group in groups:
-            indices      = group.get("fillIndices", [])
-            group_fills  = [fills[i] for i in indices if i < len(fills)]
-            if not group_fills:
-                continue
-
-            # ── Compute trade-level aggregates ──────────────────────────
-            symbol    = group_fills[0]["symbol"]
-            account   = group_fills[0]["key_trading_accounts"]
-            total_qty = sum(f["qty"] for f in group_fills)
-            total_pnl = round(sum(f["pnl"] for f in group_fills), 2)
-            total_fees = round(sum(f.get("fees", 0) for f in group_fills), 2)
-            gross_pnl = round(total_pnl + total_fees, 2)
-
-            # Determine side: if boughtTimestamp < soldTimestamp → long
-            first_fill = group_fills[0]
-            side = "long" if first_fill["boughtTimestamp"] < first_fill["soldTimestamp"] else "short"
-
-            # Entry = earliest bought (long) or sold (short) timestamp
-            if side == "long":
-                timestamps_entry = [f["boughtTimestamp"] for f in group_fills]
-                timestamps_exit  = [f["soldTimestamp"]   for f in group_fills]
-                prices_entry     = [f["buyPrice"]        for f in group_fills]
-                prices_exit      = [f["sellPrice"]       for f in group_fills]
-            else:
-                timestamps_entry = [f["soldTimestamp"]   for f in group_fills]
-                timestamps_exit  = [f["boughtTimestamp"] for f in group_fills]
-                prices_entry     = [f["sellPrice"]       for f in group_fills]
-                prices_exit      = [f["buyPrice"]        for f in group_fills]
-
-            entry_timestamp = min(timestamps_entry)
-            exit_timestamp  = max(timestamps_exit)
-
-            # Weighted average entry/exit price
-            avg_entry = round(
-                sum(p * f["qty"] for p, f in zip(prices_entry, group_fills)) / total_qty, 4
-            )
-            avg_exit = round(
-                sum(p * f["qty"] for p, f in zip(prices_exit, group_fills)) / total_qty, 4
-            )
-
-            # Duration: first entry → last exit
-            from datetime import datetime as dt
-            entry_dt   = dt.fromisoformat(entry_timestamp)
-            exit_dt    = dt.fromisoformat(exit_timestamp)
-            delta      = exit_dt - entry_dt
-            total_secs = int(delta.total_seconds())
-            hours, rem = divmod(total_secs, 3600)
-            mins, secs = divmod(rem, 60)
-            if hours:
-                duration = f"{hours}h {mins}min {secs}sec"
-            elif mins:
-                duration = f"{mins}min {secs}sec"
-            else:
-                duration = f"{secs}sec"
-
-            # ── Insert trade ─────────────────────────────────────────────
-            trade_row = {
-                "symbol":               symbol,
-                "entryTimestamp":       entry_timestamp,
-                "exitTimestamp":        exit_timestamp,
-                "entryPrice":           avg_entry,
-                "exitPrice":            avg_exit,
-                "qty":                  total_qty,
-                "pnl":                  total_pnl,
-                "gross_pnl":            gross_pnl,
-                "fees":                 total_fees,
-                "duration":             duration,
-                "side":                 side,
-                "key_trading_accounts": account,
-            }
+        chart_timeframes = meta.get("chart_timeframes", ["5m"])
 
-            trade_res = supabase_admin.table("trades").insert(trade_row).execute()
-            trade     = trade_res.data[0]
-            trade_id  = trade["id"]
-
-            # ── Insert fills linked to this trade ────────────────────────
-            fill_rows = []
-            for f in group_fills:
-                fill_rows.append({
-                    "trade_id":        trade_id,
-                    "buy_fill_id":     f.get("buyFillId"),
-                    "sell_fill_id":    f.get("sellFillId"),
-                    "qty":             f["qty"],
-                    "buy_price":       f["buyPrice"],
-                    "sell_price":      f["sellPrice"],
-                    "pnl":             f["pnl"],
-                    "bought_timestamp": f["boughtTimestamp"],
-                    "sold_timestamp":   f["soldTimestamp"],
-                    "duration":        f.get("duration"),
-                })
-            supabase_admin.table("fills").insert(fill_rows).execute()
+        # ── Trade-level aggregates for every group at once ──────────────
+        trades_df  = trade_aggregates(df_fills, group_ids)
+        trade_rows = trades_df.drop(columns=["fill_count"]).to_dict(orient="records")
 
-            # ── Generate chart ───────────────────────────────────────────
+        # ── Insert all trades, then all their fills, in batches ─────────
+        # a failure part-way leaves rows the summary never saw: rebuild those accounts
+        since    = daily_summary.snapshot()
+        inserted = []
+        try:
+            insert_all(lambda: supabase_admin.table("trades"), trade_rows, key=trade_identity, into=inserted)
+            trade_ids = pd.Series([t["id"] for t in inserted], index=trades_df.index)
+
+            in_trade  = group_ids >= 0
+            fills_df  = df_fills[in_trade]
+            fill_rows = pd.DataFrame({
+                "trade_id":         trade_ids.loc[group_ids[in_trade]].to_numpy(),
+                "buy_fill_id":      fills_df["buyFillId"].to_numpy(),
+                "sell_fill_id":     fills_df["sellFillId"].to_numpy(),
+                "qty":              fills_df["qty"].to_numpy(),
+                "buy_price":        fills_df["buyPrice"].to_numpy(),
+                "sell_price":       fills_df["sellPrice"].to_numpy(),
+                "pnl":              fills_df["pnl"].to_numpy(),
+                "bought_timestamp": fills_df["boughtTimestamp"].to_numpy(),
+                "sold_timestamp":   fills_df["soldTimestamp"].to_numpy(),
+                "duration":         fills_df["duration"].to_numpy(),
+            }).astype(object).where(lambda df: df.notna(), None).to_dict(orient="records")
+            insert_all(lambda: supabase_admin.table("fills"), fill_rows)
+        except Exception:
+            # trades left without their fills would pass the dedupe on a
+            # re-confirm and be imported twice: take them back out, or, if
+            # that fails too, make sure the staged upload cannot be confirmed again
             try:
-                chart_b64 = generate_chart_base64(
-                    symbol      = symbol,
-                    entry_time  = entry_dt,
-                    exit_time   = exit_dt,
-                    entry_price = avg_entry,
-                    exit_price  = avg_exit,
-                    side        = side,
-                    user_id     = user_id,
-                    timeframe   = chart_timeframe,
-                )
-                if chart_b64:
-                    supabase_admin.table("trades") \
-                        .update({"chart_image": chart_b64}) \
-                        .eq("id", trade_id) \
-                        .execute()
-            except Exception as e:
-                print(f"Chart error for trade {trade_id}: {e}")
-                failed_charts.append(trade_id)
-
-            inserted_trades.append(trade_id)
+                for chunk in chunked([t["id"] for t in inserted]):
+                    supabase_admin.table("fills").delete().in_("trade_id", chunk).execute()
+                    supabase_admin.table("trades").delete().in_("id", chunk).execute()
+            except Exception:
+                staging_store.discard(session.pop("upload_token", None))
+            for account_id in trades_df["key_trading_accounts"].unique():
+                daily_summary.drop(account_id)
+            raise
 
-        session.pop("preview_fills", None)
+        fills_by_trade = {}
+        for f in fill_rows:
+            fills_by_trade.setdefault(f["trade_id"], []).append(f)
+
+        chart_jobs = [{
+            "trade_id":    trade["id"],
+            "symbol":      row["symbol"],
+            "entry_time":  datetime.fromisoformat(row["entryTimestamp"]),
+            "exit_time":   datetime.fromisoformat(row["exitTimestamp"]),
+            "entry_price": row["entryPrice"],
+            "exit_price":  row["exitPrice"],
+            "side":        row["side"],
+            "timeframes":  chart_timeframes,
+            "fills":       fills_by_trade.get(trade["id"], []),
+        } for trade, row in zip(inserted, trade_rows)]
+
+        daily_summary.apply(trade_deltas(inserted), since)
+
+        # ── Charts are rendered in the background ─────────────────────
+        job_id = None
+        if chart_jobs:
+            job_id = job_queue.submit(user_id, "charts", len(chart_jobs), run_import_charts_job, user_id, chart_jobs)
+
+        staging_store.discard(session.pop("upload_token", None))
         return jsonify({
-            "ok":           True,
-            "inserted":     len(inserted_trades),
-            "failed_charts": failed_charts,
+            "ok":       True,
+            "inserted": len(inserted),
+            "job_id":   job_id,
         })
 
     except Exception as e:
@@ -785,6 +699,30 @@ def api_trades():
         date_to     = request.args.get("to")
         strategy_id = request.args.get("strategy")
         setup_ids   = request.args.getlist("setups")
+        fields      = request.args.get("fields")
+        limit       = request.args.get("limit", type=int)
+        cursor      = request.args.get("cursor")
+
+        # ===== PAGINATION (keyset on entryTimestamp, id) =====
+        paged = limit is not None or bool(cursor)
+        after = None
+        if paged:
+            if limit is not None and limit <= 0:
+                return jsonify({"error": "limit must be positive"}), 400
+            limit = min(limit or PAGE_SIZE, PAGE_SIZE)
+            try:
+                after = decode_cursor(cursor) if cursor else None
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+        # ===== COLUMN PROJECTION =====
+        fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else TRADE_COLUMNS + ["has_chart"]
+        unknown = set(fields) - TRADE_FIELDS
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+        columns = ["id"] + [f for f in fields if f not in ("id", "has_chart")]
+        if paged and "entryTimestamp" not in columns:
+            columns.append("entryTimestamp")   # the cursor is built from it
 
         # ===== GET USER ACCOUNTS =====
         accounts_res = (
@@ -798,19 +736,59 @@ def api_trades():
         if not user_account_ids:
             return jsonify([])
 
+        # ===== SETUPS FILTER: SEMI-JOIN THROUGH trade_setup =====
+        setup_trade_ids = None
+        if setup_ids:
+            setup_links = fetch_in(
+                lambda: supabase_admin.table("trade_setup").select("key_trade_id, key_setup_id"),
+                "key_setup_id", [int(s) for s in setup_ids],
+                key=None, order=("key_trade_id", "key_setup_id"),
+            )
+            setup_trade_ids = sorted({l["key_trade_id"] for l in setup_links})
+            if not setup_trade_ids:
+                return jsonify([])
+
         # ===== BUILD BASE QUERY =====
-        query = (
-            supabase_admin.table("trades")
-            .select("*")
-            .in_("key_trading_accounts", user_account_ids)
-        )
+        def build(trade_ids=None):
+            query = (
+                supabase_admin.table("trades")
+                .select(", ".join(columns))
+                .in_("key_trading_accounts", user_account_ids)
+            )
 
-        # 🔥 APPLY ACCOUNT FILTER DIRECTLY IN DB
-        if account_id:
-            query = query.eq("key_trading_accounts", account_id)
+            # 🔥 APPLY ACCOUNT FILTER DIRECTLY IN DB
+            if account_id:
+                query = query.eq("key_trading_accounts", account_id)
+
+            # 🔥 DATE / STRATEGY / SETUPS AS DB PREDICATES
+            return apply_trade_filters(
+                query,
+                date_from=date_from,
+                date_to=date_to,
+                strategy_id=strategy_id,
+                trade_ids=trade_ids,
+            )
 
-        trades_res = query.execute()
-        trades = trades_res.data or []
+        # a long setups semi-join is split into several IN chunks
+        id_chunks = list(chunked(setup_trade_ids)) if setup_trade_ids is not None else [None]
+
+        trades = []
+        if paged:
+            # one keyset page per chunk, merged back into (entryTimestamp, id) order.
+            # A server-side max-rows can cut any chunk's page short, so the merged
+            # page only runs up to the earliest point where one of them stopped.
+            bound = None
+            for chunk in id_chunks:
+                page = fetch_page(lambda: build(chunk), limit, after)
+                if page:
+                    trades.extend(page)
+                    last  = (page[-1]["entryTimestamp"], page[-1]["id"])
+                    bound = last if bound is None else min(bound, last)
+            trades.sort(key=lambda t: (t["entryTimestamp"], t["id"]))
+            trades = [t for t in trades if (t["entryTimestamp"], t["id"]) <= bound][:limit] if trades else []
+        else:
+            for chunk in id_chunks:
+                trades.extend(fetch_all(lambda: build(chunk)))
 
         if not trades:
             return jsonify([])
@@ -818,87 +796,335 @@ def api_trades():
         trade_ids = [t["id"] for t in trades]
 
         # ===== FETCH SETUPS (ONLY IF NEEDED) =====
-        links_res = (
-            supabase_admin.table("trade_setup")
-            .select("key_trade_id, key_setup_id")
-            .in_("key_trade_id", trade_ids)
-            .execute()
+        links = fetch_in(
+            lambda: supabase_admin.table("trade_setup").select("key_trade_id, key_setup_id"),
+            "key_trade_id", trade_ids,
+            key=None, order=("key_trade_id", "key_setup_id"),
         )
-        links = links_res.data or []
 
         setups_by_trade = {}
         for l in links:
             setups_by_trade.setdefault(l["key_trade_id"], []).append(l["key_setup_id"])
 
         # ===== FETCH EMOTIONS =====
-        emotions_res = (
-            supabase_admin.table("emotions_trades")
-            .select("trade_id, emotions_id")
-            .in_("trade_id", trade_ids)
-            .execute()
+        emotion_links = fetch_in(
+            lambda: supabase_admin.table("emotions_trades").select("trade_id, emotions_id"),
+            "trade_id", trade_ids,
+            key=None, order=("trade_id", "emotions_id"),
         )
-        emotion_links = emotions_res.data or []
 
         emotions_by_trade = {}
         for e in emotion_links:
             emotions_by_trade.setdefault(e["trade_id"], []).append(e["emotions_id"])
 
+        # ===== WHICH TRADES HAVE A CHART (ids only, never the image) =====
+        charted = set()
+        if "has_chart" in fields:
+            charted_rows = fetch_in(
+                lambda: supabase_admin.table("trades").select("id")
+                .or_("chart_key.not.is.null,chart_image.not.is.null"),
+                "id", trade_ids,
+            )
+            charted = {c["id"] for c in charted_rows}
+
         # ===== MERGE DATA =====
         for t in trades:
+            if t.get("chart_key"):
+                chart_owner_cache.set((user_id, t["chart_key"]), True)
             t["setups"]   = setups_by_trade.get(t["id"], [])
             t["emotions"] = emotions_by_trade.get(t["id"], [])
+            if "has_chart" in fields:
+                t["has_chart"] = t["id"] in charted
+
+        # a short page is not the last one when max-rows is below `limit`:
+        # the client follows the cursor until it gets an empty page
+        response = jsonify(trades)
+        if paged:
+            response.headers["X-Next-Cursor"] = encode_cursor(trades[-1])
+        return response
+
+    except Exception as e:
+        print("api/trades error:", e)
+        return jsonify({"error": str(e)}), 500
+
+def get_user_trade(trade_id, columns):
+    """
+    (trade, None) for a trade in one of the current user's accounts, else
+    (None, error response) with 404 / 403. `columns` must include key_trading_accounts.
+    """
+    trade_res = (
+        supabase_admin.table("trades")
+        .select(columns)
+        .eq("id", trade_id)
+        .execute()
+    )
+    if not trade_res.data:
+        return None, (jsonify({"error": "Trade not found"}), 404)
+
+    accounts_res = (
+        supabase_admin.table("trading_accounts")
+        .select("id")
+        .eq("user_id", session["user"]["id"])
+        .execute()
+    )
+    user_account_ids = [a["id"] for a in (accounts_res.data or [])]
+    trade = trade_res.data[0]
+    if trade["key_trading_accounts"] not in user_account_ids:
+        return None, (jsonify({"error": "Unauthorized"}), 403)
+    return trade, None
+
+def release_chart_keys(keys):
+    """
+    Delete the blobs (and their encodings) of chart keys that no trade or
+    timeframe row references any more; called after rows naming them were
+    deleted or repointed. Keys are shared by content, across users too.
+    """
+    keys = {k for k in keys if k}
+    if not keys:
+        return
+    referenced = set()
+    for table in ("trades", "trade_charts"):
+        for chunk in chunked(keys, 50):   # 64-char keys: keep the IN list short
+            rows = fetch_all(lambda: supabase_admin.table(table).select("id, chart_key").in_("chart_key", chunk))
+            referenced.update(r["chart_key"] for r in rows)
+    for key in keys - referenced:
+        if blob_store.delete(key, grace=CHART_GC_GRACE):
+            chart_variants.delete(key)
+
+def user_owns_chart(key):
+    """True when a trade (or one of its timeframe variants) of the current user references `key`."""
+    user_id = session["user"]["id"]
+    if chart_owner_cache.get((user_id, key)):
+        return True
+
+    owned = (
+        supabase_admin.table("trades")
+        .select("id, trading_accounts!inner(user_id)")
+        .eq("chart_key", key)
+        .eq("trading_accounts.user_id", user_id)
+        .limit(1)
+        .execute()
+    ).data or (
+        supabase_admin.table("trade_charts")
+        .select("trade_id, trades!inner(trading_accounts!inner(user_id))")
+        .eq("chart_key", key)
+        .eq("trades.trading_accounts.user_id", user_id)
+        .limit(1)
+        .execute()
+    ).data
+    if owned:
+        chart_owner_cache.set((user_id, key), True)
+    return bool(owned)
+
+@app.get("/api/trades/<int:trade_id>/chart")
+@login_required
+def get_trade_chart(trade_id):
+    """
+    The trade's chart (or its ?tf= timeframe, ?size=thumb|full encoding): a
+    redirect to the immutable blob URL, or the legacy inline PNG revalidated by ETag.
+    """
+    try:
+        timeframe = request.args.get("tf")
+        size      = request.args.get("size")
+        if size and size not in IMAGE_VARIANTS:
+            return jsonify({"error": f"Unknown size: {size}"}), 400
+        # one query: the chart row, restricted to trades in the user's accounts
+        user_id = session["user"]["id"]
+        if timeframe:
+            chart_res = (
+                supabase_admin.table("trade_charts")
+                .select("chart_key, chart_image, trades!inner(trading_accounts!inner(user_id))")
+                .eq("trade_id", trade_id)
+                .eq("timeframe", timeframe)
+                .eq("trades.trading_accounts.user_id", user_id)
+                .execute()
+            )
+        else:
+            chart_res = (
+                supabase_admin.table("trades")
+                .select("chart_key, chart_image, trading_accounts!inner(user_id)")
+                .eq("id", trade_id)
+                .eq("trading_accounts.user_id", user_id)
+                .execute()
+            )
+        chart = chart_res.data[0] if chart_res.data else {}
+
+        if chart.get("chart_key"):
+            chart_owner_cache.set((user_id, chart["chart_key"]), True)
+            if size:
+                return redirect(url_for("get_chart_variant", key=chart["chart_key"], variant=size))
+            return redirect(url_for("get_chart_blob", key=chart["chart_key"]))
+        if not chart.get("chart_image"):
+            return jsonify({"error": "No chart"}), 404
+
+        response = Response(base64.b64decode(chart["chart_image"]), mimetype="image/png")
+        response.set_etag(hashlib.sha1(chart["chart_image"].encode()).hexdigest())
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/charts/<key>")
+@login_required
+def get_chart_blob(key):
+    """A chart image by content key; the bytes behind a key never change, so it is cached for good."""
+    try:
+        if not user_owns_chart(key):
+            return jsonify({"error": "Chart not found"}), 404
+        data = blob_store.get(key)
+        if data is None:
+            return jsonify({"error": "Chart not found"}), 404
+
+        response = Response(data, mimetype="image/png")
+        response.set_etag(key)
+        response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/charts/<key>/<variant>")
+@login_required
+def get_chart_variant(key, variant):
+    """A chart's thumbnail or full-size encoding; derived from an immutable blob, so cached for good too."""
+    try:
+        if variant not in IMAGE_VARIANTS:
+            return jsonify({"error": f"Unknown size: {variant}"}), 404
+        if not user_owns_chart(key):
+            return jsonify({"error": "Chart not found"}), 404
+        data = chart_variants.get(key, variant)
+        if data is None:
+            return jsonify({"error": "Chart not found"}), 404
+
+        response = Response(data, mimetype=chart_variants.mimetype)
+        response.set_etag(chart_variants.etag(key, variant))
+        response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response.make_conditional(request)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/trades/<int:trade_id>/charts")
+@login_required
+def get_trade_chart_timeframes(trade_id):
+    """Timeframes this trade has a rendered chart for (the images are fetched separately)."""
+    try:
+        trade, error = get_user_trade(trade_id, "key_trading_accounts")
+        if error:
+            return error
+
+        charts_res = (
+            supabase_admin.table("trade_charts")
+            .select("timeframe")
+            .eq("trade_id", trade_id)
+            .execute()
+        )
+        timeframes = sorted((c["timeframe"] for c in charts_res.data or []), key=timeframe_seconds)
+        return jsonify({"timeframes": timeframes})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/trades/<int:trade_id>/chart-data")
+@login_required
+def get_trade_chart_data(trade_id):
+    """
+    The trade's chart as columnar JSON for client-side drawing: trimmed
+    candles, MA/VWAP series and fill markers at ?tf= (default 5m).
+    """
+    try:
+        timeframe = request.args.get("tf", "5m")
+        try:
+            timeframe_seconds(timeframe)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # ===== FINAL FILTERING (date, strategy, setups) =====
-        trades = filter_trades(
-            trades,
-            date_from=date_from,
-            date_to=date_to,
-            strategy_id=strategy_id,
-            setup_ids=setup_ids,
+        trade, error = get_user_trade(
+            trade_id, "key_trading_accounts, symbol, side, entryTimestamp, exitTimestamp, entryPrice, exitPrice",
         )
+        if error:
+            return error
 
-        return jsonify(trades)
+        fills_res = (
+            supabase_admin.table("fills")
+            .select("buy_price, sell_price, bought_timestamp, sold_timestamp")
+            .eq("trade_id", trade_id)
+            .execute()
+        )
+        entry_time = datetime.fromisoformat(trade["entryTimestamp"])
+        windows    = candle_windows(trade["symbol"], entry_time, [timeframe])
+        if not windows:
+            return jsonify({"error": f"No {timeframe} candles available for this trade"}), 404
+        candles    = candle_store.candles(*next(iter(windows)))
+        chart      = TradeChart(
+            candles,
+            entry_time  = entry_time,
+            exit_time   = datetime.fromisoformat(trade["exitTimestamp"]),
+            entry_price = float(trade["entryPrice"]),
+            exit_price  = float(trade["exitPrice"]),
+            side        = trade["side"],
+            settings    = get_user_settings(session["user"]["id"]),
+            fills       = fills_res.data or None,   # None for legacy trades → single marker fallback
+        )
+        data = chart.data(timeframe)
+        if data is None:
+            return jsonify({"error": "No candles in trade window"}), 404
+
+        response = jsonify(data)
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response.make_conditional(request)
 
+    except YahooError as e:
+        return jsonify({"error": e.status, "body": e.body}), 502
     except Exception as e:
-        print("api/trades error:", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/yahoo/<symbol>")
 @login_required
 def fetch_yahoo(symbol):
     try:
-        yahoo_symbol = symbol if symbol.endswith("=F") else f"{symbol}=F"
+        yahoo_symbol = yahoo_symbol_for(symbol)
         date_str     = request.args.get("date")
         interval     = request.args.get("interval", "5m")
-        range_param  = request.args.get("range", None)
+        range_param  = request.args.get("range", None) or "1d"
+
+        # Both end up in candle store paths: only known intervals and plain symbols
+        if interval not in dict(YAHOO_INTERVALS) or not SYMBOL_PATTERN.fullmatch(yahoo_symbol):
+            return jsonify({"error": "Invalid symbol or interval"}), 400
 
         if date_str:
-            trade_date = datetime.strptime(date_str, "%Y-%m-%d")
-            period1    = int((trade_date - timedelta(days=1)).timestamp())
-            period2    = int((trade_date + timedelta(days=1)).timestamp())
-            url = (
-                f"https://query1.finance.yahoo.com/v8/finance/chart/{yahoo_symbol}"
-                f"?interval={interval}&period1={period1}&period2={period2}"
-            )
+            trade_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+            key        = (yahoo_symbol, interval, "date", trade_date)
         else:
-            r = range_param or "1d"
-            url = (
-                f"https://query1.finance.yahoo.com/v8/finance/chart/{yahoo_symbol}"
-                f"?interval={interval}&range={r}"
-            )
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept":     "application/json",
-            "Referer":    "https://finance.yahoo.com",
-        }
-
-        r = requests.get(url, headers=headers, timeout=10)
-        if not r.ok:
-            return jsonify({"error": r.status_code, "body": r.text[:500]}), 502
-
-        return jsonify(r.json())
+            key        = (yahoo_symbol, interval, "range", range_param)
+
+        cached = yahoo_cache.get(key)
+        if cached is None:
+            if date_str:
+                # Historical day → served from the local candle store
+                candles = candle_store.candles(yahoo_symbol, interval, trade_date - timedelta(days=1), trade_date)
+                payload = to_yahoo_payload(yahoo_symbol, interval, candles)
+                final   = settled(trade_date)
+            else:
+                # Live range → pass-through, held for a few seconds
+                payload = fetch_chart(yahoo_symbol, interval, range_param=range_param)
+                final   = False
+            body   = app.json.dumps(payload).encode()
+            cached = (body, hashlib.sha1(body).hexdigest(), final)
+            yahoo_cache.set(key, cached, ttl=None if final else YAHOO_LIVE_TTL)
+
+        body, etag, final = cached
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = (
+            "private, max-age=86400, immutable" if final else f"private, max-age={YAHOO_LIVE_TTL}"
+        )
+        return response.make_conditional(request)
 
+    except YahooError as e:
+        return jsonify({"error": e.status, "body": e.body}), 502
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -911,10 +1137,34 @@ def delete_trades():
     if not ids:
         return {"error": "No IDs provided"}, 400
 
-    # Cascade delete junction tables first
-    supabase_admin.table("emotions_trades").delete().in_("trade_id", ids).execute()
-    supabase_admin.table("trade_setup").delete().in_("key_trade_id", ids).execute()
-    supabase_admin.table("trades").delete().in_("id", ids).execute()
+    # Read what the summary has to take back out, and which chart images
+    # they name, before the rows are gone
+    deleted = fetch_in(
+        lambda: supabase_admin.table("trades").select("id, key_trading_accounts, entryTimestamp, pnl, chart_key"),
+        "id", ids,
+    )
+    charts = fetch_in(lambda: supabase_admin.table("trade_charts").select("id, chart_key"), "trade_id", ids)
+
+    since = daily_summary.snapshot()
+
+    # Cascade delete junction tables first; a failure part-way leaves the
+    # summary unable to tell which trades went, so their accounts are rebuilt
+    try:
+        for chunk in chunked(ids):
+            supabase_admin.table("emotions_trades").delete().in_("trade_id", chunk).execute()
+            supabase_admin.table("trade_setup").delete().in_("key_trade_id", chunk).execute()
+            supabase_admin.table("trade_charts").delete().in_("trade_id", chunk).execute()
+            supabase_admin.table("trades").delete().in_("id", chunk).execute()
+    except Exception:
+        for account_id in {t["key_trading_accounts"] for t in deleted}:
+            daily_summary.drop(account_id)
+        raise
+    finally:
+        for account_id in {t["key_trading_accounts"] for t in deleted}:
+            fill_key_cache.invalidate(int(account_id))
+
+    daily_summary.apply(trade_deltas(deleted, -1), since)
+    release_chart_keys([t["chart_key"] for t in deleted] + [c["chart_key"] for c in charts])
     return {"deleted": len(ids)}
 
 @app.get("/api/accounts")
@@ -950,32 +1200,68 @@ def delete_account(id):
     user_id = session["user"]["id"]
 
     # 1. Get all trades linked to this account
-    trades_res = (
-        supabase_admin.table("trades")
-        .select("id")
+    trades = fetch_all(
+        lambda: supabase_admin.table("trades")
+        .select("id, chart_key")
         .eq("key_trading_accounts", id)
-        .execute()
     )
-    trade_ids = [t["id"] for t in (trades_res.data or [])]
+    trade_ids = [t["id"] for t in trades]
+    charts    = fetch_in(lambda: supabase_admin.table("trade_charts").select("id, chart_key"), "trade_id", trade_ids)
 
     # 2. Cascade delete junction tables first
-    if trade_ids:
-        supabase_admin.table("emotions_trades").delete().in_("trade_id", trade_ids).execute()
-        supabase_admin.table("trade_setup").delete().in_("key_trade_id", trade_ids).execute()
-        supabase_admin.table("trades").delete().in_("id", trade_ids).execute()
+    for chunk in chunked(trade_ids):
+        supabase_admin.table("emotions_trades").delete().in_("trade_id", chunk).execute()
+        supabase_admin.table("trade_setup").delete().in_("key_trade_id", chunk).execute()
+        supabase_admin.table("trade_charts").delete().in_("trade_id", chunk).execute()
+        supabase_admin.table("trades").delete().in_("id", chunk).execute()
 
     # 3. Now safe to delete the account
     supabase_admin.table("trading_accounts").delete().eq("id", id).eq("user_id", user_id).execute()
+    daily_summary.drop(id)
+    fill_key_cache.invalidate(int(id))
+    release_chart_keys([t["chart_key"] for t in trades] + [c["chart_key"] for c in charts])
     return {"ok": True}
 
 @app.patch("/api/trades/<id>")
 @login_required
 def update_trade(id):
     data     = request.json
+
+    # a dropped-in picture is stored like a rendered chart: by key, not inline
+    replaced = []
+    if "chart_image" in data:
+        image = data.pop("chart_image")
+        data["chart_key"]   = blob_store.put(base64.b64decode(image)) if image else None
+        data["chart_image"] = None
+        replaced = (
+            supabase_admin.table("trades")
+            .select("chart_key")
+            .eq("id", id)
+            .execute()
+        ).data or []
+
+    # edits that move P&L between days/accounts are replayed on the summary
+    touches_summary = bool({"pnl", "entryTimestamp", "key_trading_accounts"} & set(data))
+    if touches_summary:
+        since  = daily_summary.snapshot()
+        before = (
+            supabase_admin.table("trades")
+            .select("key_trading_accounts, entryTimestamp, pnl")
+            .eq("id", id)
+            .execute()
+        ).data or []
+
     response = supabase_admin.table("trades").update(data).eq("id", id).execute()
 
     if response.data is None:
         return {"error": "Update failed"}, 400
+    if touches_summary:
+        daily_summary.replace(before, response.data, since)
+    if "key_trading_accounts" in data:
+        # the trade's fills moved to another account
+        for trade in before + response.data:
+            fill_key_cache.invalidate(int(trade["key_trading_accounts"]))
+    release_chart_keys(r["chart_key"] for r in replaced)
     return {"ok": True}
 
 # ===== STRATEGIES =====
@@ -1025,10 +1311,11 @@ def bulk_strategy():
     ids = data.get("ids", [])
     strategy_id = data.get("strategy_id")
 
-    supabase_admin.table("trades") \
-        .update({"key_strategies_id": strategy_id}) \
-        .in_("id", ids) \
-        .execute()
+    for chunk in chunked(ids):
+        supabase_admin.table("trades") \
+            .update({"key_strategies_id": strategy_id}) \
+            .in_("id", chunk) \
+            .execute()
 
     return {"ok": True}
 
@@ -1099,11 +1386,12 @@ def bulk_setups():
             .execute()
 
     for setup_id in remove:
-        supabase_admin.table("trade_setup") \
-            .delete() \
-            .in_("key_trade_id", ids) \
-            .eq("key_setup_id", setup_id) \
-            .execute()
+        for chunk in chunked(ids):
+            supabase_admin.table("trade_setup") \
+                .delete() \
+                .in_("key_trade_id", chunk) \
+                .eq("key_setup_id", setup_id) \
+                .execute()
 
     return {"ok": True}
 
@@ -1130,14 +1418,13 @@ def get_trade_setups():
         if not trade_ids:
             return jsonify([])
 
-        res = (
-            supabase_admin.table("trade_setup")
-            .select("*")
-            .in_("key_trade_id", trade_ids)
-            .execute()
+        links = fetch_in(
+            lambda: supabase_admin.table("trade_setup").select("*"),
+            "key_trade_id", trade_ids,
+            key=None, order=("key_trade_id", "key_setup_id"),
         )
 
-        return jsonify(res.data or [])
+        return jsonify(links)
     except Exception as e:
         print("GET /api/trade_setups error:", e)
         return jsonify({"error": str(e)}), 500
@@ -1237,11 +1524,12 @@ def bulk_emotions():
             .execute()
 
     for emotion_id in remove:
-        supabase_admin.table("emotions_trades") \
-            .delete() \
-            .in_("trade_id", ids) \
-            .eq("emotions_id", emotion_id) \
-            .execute()
+        for chunk in chunked(ids):
+            supabase_admin.table("emotions_trades") \
+                .delete() \
+                .in_("trade_id", chunk) \
+                .eq("emotions_id", emotion_id) \
+                .execute()
 
     return {"ok": True}
 
@@ -1267,14 +1555,13 @@ def get_emotions_trades():
         if not trade_ids:
             return jsonify([])
 
-        res = (
-            supabase_admin.table("emotions_trades")
-            .select("*")
-            .in_("trade_id", trade_ids)
-            .execute()
+        links = fetch_in(
+            lambda: supabase_admin.table("emotions_trades").select("*"),
+            "trade_id", trade_ids,
+            key=None, order=("trade_id", "emotions_id"),
         )
 
-        return jsonify(res.data or [])
+        return jsonify(links)
     except Exception as e:
         print("GET /api/emotions_trades error:", e)
         return jsonify({"error": str(e)}), 500
@@ -1309,18 +1596,8 @@ def onboarding_status():
         .execute()
     )
 
-    settings_res = (
-        supabase_admin.table("settings")
-        .select("timezone")
-        .eq("user_id", user_id)
-        .execute()
-    )
-
     has_account = len(accounts_res.data or []) > 0
-
-    timezone = None
-    if settings_res.data:
-        timezone = settings_res.data[0].get("timezone")
+    timezone    = get_user_settings(user_id).get("timezone")
 
     return jsonify({
         "has_account": has_account,
@@ -1409,41 +1686,43 @@ def apply_fees_bulk():
         fees_map = {f["symbol"]: f["fees"] for f in (fees_res.data or [])}
 
         # ===== GET TRADES =====
-        trades_res = (
-            supabase_admin.table("trades")
-            .select("*")
-            .in_("id", ids)
-            .execute()
+        trades = fetch_in(
+            lambda: supabase_admin.table("trades").select("id, symbol, qty, gross_pnl, pnl, entryTimestamp, key_trading_accounts"),
+            "id", ids,
         )
-
-        trades = trades_res.data or []
         updated = []
+        repriced = []
+        since = daily_summary.snapshot()
 
-        for t in trades:
-            symbol = t["symbol"]
-            fee    = fees_map.get(symbol, 0)
-
-            qty = float(t.get("qty") or 1)
+        try:
+            for t in trades:
+                symbol = t["symbol"]
+                fee    = fees_map.get(symbol, 0)
 
-            # fees table = round-trip per contract
-            new_fees = fee
+                qty = float(t.get("qty") or 1)
 
-            gross_pnl = float(t.get("gross_pnl") or 0)
+                # fees table = round-trip per contract
+                new_fees = fee
 
-            # ✅ recompute from source of truth
-            pnl = gross_pnl - (qty * new_fees)
+                gross_pnl = float(t.get("gross_pnl") or 0)
 
-            supabase_admin.table("trades").update({
-                "fees": new_fees,
-                "pnl": pnl
-            }).eq("id", t["id"]).execute()
+                # ✅ recompute from source of truth
+                pnl = gross_pnl - (qty * new_fees)
 
-            updated.append({
-                "id": t["id"],
-                "fees": new_fees,
-                "pnl": pnl
-            })
+                supabase_admin.table("trades").update({
+                    "fees": new_fees,
+                    "pnl": pnl
+                }).eq("id", t["id"]).execute()
 
+                updated.append({
+                    "id": t["id"],
+                    "fees": new_fees,
+                    "pnl": pnl
+                })
+                repriced.append({**t, "pnl": pnl})
+        finally:
+            # the trades re-priced before any failure still move the summary
+            daily_summary.replace(trades[:len(repriced)], repriced, since)
         return jsonify(updated)
 
     except Exception as e:
@@ -1456,15 +1735,7 @@ def apply_fees_bulk():
 @login_required
 def get_settings():
     try:
-        user_id  = session["user"]["id"]
-        response = (
-            supabase_admin.table("settings")
-            .select("*")
-            .eq("user_id", user_id)
-            .execute()
-        )
-        data = response.data
-        return jsonify(data[0] if data else {})
+        return jsonify(get_user_settings(session["user"]["id"]))
     except Exception as e:
         print("Supabase GET /api/settings error:", e)
         return jsonify({}), 200
@@ -1484,16 +1755,20 @@ def update_settings():
             .execute()
         )
 
-        if existing.data:
-            supabase_admin.table("settings") \
-                .update(data) \
-                .eq("user_id", user_id) \
-                .execute()
-        else:
-            data["user_id"] = user_id
-            supabase_admin.table("settings") \
-                .insert(data) \
-                .execute()
+        try:
+            if existing.data:
+                supabase_admin.table("settings") \
+                    .update(data) \
+                    .eq("user_id", user_id) \
+                    .execute()
+            else:
+                data["user_id"] = user_id
+                supabase_admin.table("settings") \
+                    .insert(data) \
+                    .execute()
+        finally:
+            # even a failed write may have landed: never keep serving the old row
+            settings_cache.invalidate(user_id)
 
         # 2. IMPORTANT: sync timezone into session immediately
         if "timezone" in data:
@@ -1561,82 +1836,163 @@ def signup():
         prefill_email=prefill_email,
     )
 
+# ===== BACKGROUND CHART JOBS =====
+def store_rendered_charts(job, chart_jobs):
+    """
+    Render chart_jobs in the pool and store each trade's charts as soon as
+    they are ready: the PNGs go to the blob store, trade_charts gets a key and
+    the render fingerprint per timeframe, and the job's primary timeframe
+    (its first unless given) also becomes the trade's own chart_key. The
+    thumbnail and full-size encodings are made here too, off the request path,
+    and the images a job `replaces` are released once nothing names them.
+    """
+    by_trade = {chart_job["trade_id"]: chart_job for chart_job in chart_jobs}
+    for trade_id, charts in chart_engine.render_many(chart_jobs):
+        chart_job = by_trade[trade_id]
+        keys = {tf: blob_store.put(png) for tf, png in charts.items() if png}
+        ok = False
+        if keys:
+            try:
+                for tf, key in keys.items():
+                    chart_variants.warm(key, charts[tf])
+                supabase_admin.table("trade_charts").upsert([
+                    {
+                        "trade_id":    trade_id,
+                        "timeframe":   tf,
+                        "chart_key":   key,
+                        "chart_image": None,
+                        "fingerprint": render_fingerprint(chart_job, tf),
+                    }
+                    for tf, key in keys.items()
+                ], on_conflict="trade_id,timeframe").execute()
+                primary = chart_job.get("primary") or next(iter(charts))
+                if primary in charts:
+                    # a primary that could not be drawn falls back to the first one that was
+                    supabase_admin.table("trades") \
+                        .update({"chart_key": keys.get(primary) or next(iter(keys.values())), "chart_image": None}) \
+                        .eq("id", trade_id) \
+                        .execute()
+                ok = True
+                release_chart_keys(set(chart_job.get("replaces", ())) - set(keys.values()))
+            except Exception as e:
+                print(f"Chart error {trade_id}: {e}")
+        job.advance(trade_id, ok)
+
+def run_import_charts_job(job, user_id, chart_jobs):
+    settings = get_user_settings(user_id)
+    for chart_job in chart_jobs:
+        chart_job["settings"] = settings
+    store_rendered_charts(job, chart_jobs)
+
+def run_generate_charts_job(job, user_id, ids, timeframes):
+    trades = fetch_in(
+        lambda: supabase_admin.table("trades")
+        .select("id, symbol, side, entryTimestamp, exitTimestamp, entryPrice, exitPrice, chart_key"),
+        "id", ids,
+    )
+    job.set_total(len(trades))
+
+    # Fetch ALL fills for these trades, a page/chunk at a time
+    fills = fetch_in(
+        lambda: supabase_admin.table("fills")
+        .select("id, trade_id, buy_price, sell_price, bought_timestamp, sold_timestamp"),
+        "trade_id", ids,
+    )
+
+    # Group fills by trade_id
+    fills_by_trade = {}
+    for f in fills:
+        tid = f["trade_id"]
+        fills_by_trade.setdefault(tid, []).append(f)
+
+    # What every requested timeframe was last drawn from
+    stored = fetch_in(
+        lambda: supabase_admin.table("trade_charts").select("trade_id, timeframe, chart_key, fingerprint"),
+        "trade_id", ids,
+        key=None, order=("trade_id", "timeframe"),
+    )
+    stored = {(c["trade_id"], c["timeframe"]): c for c in stored}
+
+    settings = get_user_settings(user_id)
+
+    chart_jobs = []
+    cached     = []
+    for trade in trades:
+        entry_time = datetime.fromisoformat(trade["entryTimestamp"])
+        # timeframes Yahoo has no fine enough candles left for are not drawn, nor counted as stale
+        planned  = {tf for tfs in candle_windows(trade["symbol"], entry_time, timeframes).values() for tf in tfs}
+        drawable = [tf for tf in timeframes if tf in planned]
+        chart_job = {
+            "trade_id":    trade["id"],
+            "symbol":      trade["symbol"],
+            "entry_time":  entry_time,
+            "exit_time":   datetime.fromisoformat(trade["exitTimestamp"]),
+            "entry_price": float(trade["entryPrice"]),
+            "exit_price":  float(trade["exitPrice"]),
+            "side":        trade["side"],
+            "settings":    settings,
+            "timeframes":  timeframes,
+            "primary":     drawable[0] if drawable else timeframes[0],
+            "fills":       fills_by_trade.get(trade["id"]) or None,   # None for legacy trades → single marker fallback
+        }
+
+        # only timeframes whose inputs changed since their last render are drawn again
+        stale = []
+        for tf in drawable:
+            chart = stored.get((trade["id"], tf))
+            if not (chart and blob_store.exists(chart["chart_key"])
+                    and chart["fingerprint"] == render_fingerprint(chart_job, tf)):
+                stale.append(tf)
+
+        primary = stored.get((trade["id"], chart_job["primary"]))
+        if drawable and drawable[0] not in stale and primary["chart_key"] != trade["chart_key"]:
+            # up to date, just not the trade's current chart
+            supabase_admin.table("trades") \
+                .update({"chart_key": primary["chart_key"], "chart_image": None}) \
+                .eq("id", trade["id"]) \
+                .execute()
+            release_chart_keys([trade["chart_key"]])
+
+        if stale or not drawable:
+            replaces = [stored[(trade["id"], tf)]["chart_key"] for tf in stale if (trade["id"], tf) in stored]
+            chart_jobs.append({**chart_job, "timeframes": stale or timeframes, "replaces": replaces + [trade["chart_key"]]})
+        else:
+            cached.append(trade["id"])
+
+    job.skip(cached)
+    store_rendered_charts(job, chart_jobs)
+
 @app.post("/api/trades/generate-charts")
 @login_required
 def generate_charts():
     try:
-        data      = request.json
-        ids       = data.get("ids", [])
-        timeframe = data.get("timeframe", "5m")
+        data = request.json
+        ids  = data.get("ids", [])
 
         if not ids:
             return jsonify({"error": "No trade IDs"}), 400
+        try:
+            # one timeframe, or a bundle (e.g. ["1m", "5m", "15m"]) rendered in the same pass
+            timeframes = parse_timeframes(data.get("timeframes") or data.get("timeframe", "5m"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        trades_res = (
-            supabase_admin.table("trades")
-            .select("*")
-            .in_("id", ids)
-            .execute()
-        )
-
-        trades = trades_res.data or []
-
-        # Fetch ALL fills for these trades in one query
-        fills_res = (
-            supabase_admin.table("fills")
-            .select("trade_id, buy_price, sell_price, bought_timestamp, sold_timestamp")
-            .in_("trade_id", ids)
-            .execute()
-        )
-
-        # Group fills by trade_id
-        fills_by_trade = {}
-        for f in (fills_res.data or []):
-            tid = f["trade_id"]
-            fills_by_trade.setdefault(tid, []).append(f)
-
-        failed  = []
-        updated = []
         user_id = session["user"]["id"]
-
-        for trade in trades:
-            try:
-                trade_fills = fills_by_trade.get(trade["id"]) or None
-
-                chart_b64 = generate_chart_base64(
-                    symbol      = trade["symbol"],
-                    entry_time  = datetime.fromisoformat(trade["entryTimestamp"]),
-                    exit_time   = datetime.fromisoformat(trade["exitTimestamp"]),
-                    entry_price = float(trade["entryPrice"]),
-                    exit_price  = float(trade["exitPrice"]),
-                    side        = trade["side"],
-                    user_id     = user_id,
-                    timeframe   = timeframe,
-                    fills       = trade_fills,   # None for legacy trades → single marker fallback
-                )
-
-                if chart_b64:
-                    supabase_admin.table("trades") \
-                        .update({"chart_image": chart_b64}) \
-                        .eq("id", trade["id"]) \
-                        .execute()
-                    updated.append(trade["id"])
-                else:
-                    failed.append(trade["id"])
-
-            except Exception as e:
-                print(f"Chart error {trade['id']}: {e}")
-                failed.append(trade["id"])
-
-        return jsonify({
-            "ok":      True,
-            "updated": updated,
-            "failed":  failed,
-        })
+        job_id  = job_queue.submit(user_id, "charts", len(ids), run_generate_charts_job, user_id, ids, timeframes)
+        return jsonify({"ok": True, "job_id": job_id}), 202
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.get("/api/jobs/<job_id>")
+@login_required
+def get_job(job_id):
+    """Progress of a background job: {status, total, done, updated, failed, error}."""
+    job = job_queue.get(job_id)
+    if not job or job["owner"] != session["user"]["id"]:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
 @app.route("/logs")
 @login_required
 def logs():
@@ -1709,11 +2065,16 @@ def update_log(id):
 @app.get("/api/trades/summary")
 @login_required
 def trades_summary():
-    """Returns [{date, trades, pnl}] for a given month — used by the logs page footer."""
+    """
+    Returns [{date, trades, pnl}] for a given month (year + month) or a whole
+    year (year only) — used by the logs page footer. Served from the
+    materialised daily summary; `account` narrows it to one account.
+    """
     try:
-        user_id = session["user"]["id"]
-        year    = request.args.get("year")
-        month   = request.args.get("month")
+        user_id    = session["user"]["id"]
+        year       = request.args.get("year")
+        month      = request.args.get("month")
+        account_id = request.args.get("account")
 
         # get all account IDs for this user
         accounts_res = (
@@ -1723,42 +2084,108 @@ def trades_summary():
             .execute()
         )
         account_ids = [a["id"] for a in (accounts_res.data or [])]
+        if account_id:
+            account_ids = [a for a in account_ids if str(a) == str(account_id)]
         if not account_ids:
             return jsonify([])
 
-        query = (
-            supabase_admin.table("trades")
-            .select("entryTimestamp, pnl")
-            .in_("key_trading_accounts", account_ids)
-        )
-
+        date_from = date_to = None
         if year and month:
-            from datetime import date
             y, m = int(year), int(month)
             date_from = f"{y}-{m:02d}-01"
             date_to   = f"{y+1}-01-01" if m == 12 else f"{y}-{m+1:02d}-01"
-            query = query.gte("entryTimestamp", date_from).lt("entryTimestamp", date_to)
+        elif year:
+            y = int(year)
+            date_from, date_to = f"{y}-01-01", f"{y+1}-01-01"
 
-        res    = query.execute()
-        trades = res.data or []
+        daily_summary.ensure(account_ids, load_account_trades_for_summary)
+        return jsonify(daily_summary.days(account_ids, date_from, date_to))
 
-        # group by date
-        from collections import defaultdict
-        by_date = defaultdict(lambda: {"trades": 0, "pnl": 0.0})
-        for t in trades:
-            # entryTimestamp is "YYYY-MM-DD HH:MM:SS" or ISO string
-            date_str = str(t["entryTimestamp"])[:10]
-            by_date[date_str]["trades"] += 1
-            by_date[date_str]["pnl"]    += float(t["pnl"] or 0)
+    except Exception as e:
+        print("GET /api/trades/summary error:", e)
+        return jsonify({"error": str(e)}), 500
+
+
+@app.get("/api/analytics")
+@login_required
+def api_analytics():
+    """
+    Dashboard metrics (month / year / full-account stats, equity curves,
+    streaks, drawdown, hour and weekday breakdowns) computed server-side.
+
+    Takes the dashboard's account, year and month (1-12) plus its tag filters:
+    strategy / setups / emotions id lists, each with a *_logic of "or" or "and".
+    """
+    try:
+        user_id    = session["user"]["id"]
+        account_id = request.args.get("account")
+        today      = datetime.now()
+        year       = request.args.get("year", today.year, type=int)
+        month      = request.args.get("month", today.month, type=int)
+        if not 1 <= month <= 12:
+            return jsonify({"error": "month must be 1-12"}), 400
+
+        tag_filters = {
+            kind: (
+                [int(i) for i in request.args.getlist(kind)],
+                request.args.get(f"{kind}_logic", "or"),
+            )
+            for kind in ("strategy", "setups", "emotions")
+        }
+
+        accounts_res = (
+            supabase_admin.table("trading_accounts")
+            .select("id")
+            .eq("user_id", user_id)
+            .execute()
+        )
+        user_account_ids = [a["id"] for a in (accounts_res.data or [])]
+
+        strategy_ids, strategy_logic = tag_filters["strategy"]
+        # a trade has a single strategy, so "and" over several can never match
+        no_match = strategy_logic == "and" and len(set(strategy_ids)) > 1
+
+        rows = []
+        if user_account_ids and not no_match:
+            def build():
+                query = (
+                    supabase_admin.table("trades")
+                    .select("id, entryTimestamp, exitTimestamp, pnl")
+                    .in_("key_trading_accounts", user_account_ids)
+                )
+                if account_id:
+                    query = query.eq("key_trading_accounts", account_id)
+                if strategy_ids:
+                    query = query.in_("key_strategies_id", strategy_ids)
+                return query
 
-        result = [
-            {"date": d, "trades": v["trades"], "pnl": round(v["pnl"], 2)}
-            for d, v in sorted(by_date.items())
-        ]
-        return jsonify(result)
+            rows = fetch_all(build)
+
+        trades = pd.DataFrame(rows, columns=["id", "entryTimestamp", "exitTimestamp", "pnl"])
+
+        # ===== SETUP / EMOTION FILTERS: VECTORISED OVER THE LINK TABLES =====
+        junctions = {
+            "setups":   ("trade_setup",     "key_trade_id", "key_setup_id"),
+            "emotions": ("emotions_trades", "trade_id",     "emotions_id"),
+        }
+        for kind, (table, trade_col, tag_col) in junctions.items():
+            tag_ids, logic = tag_filters[kind]
+            if not tag_ids or trades.empty:
+                continue
+            links = fetch_in(
+                lambda: supabase_admin.table(table).select(f"{trade_col}, {tag_col}"),
+                tag_col, tag_ids,
+                key=None, order=(trade_col, tag_col),
+            )
+            links = pd.DataFrame(links, columns=[trade_col, tag_col]).rename(
+                columns={trade_col: "trade_id", tag_col: "tag_id"}
+            )
+            trades = trades[tag_mask(trades["id"], links, tag_ids, logic)]
+
+        return jsonify(compute_analytics(trades, year, month))
 
     except Exception as e:
-        print("GET /api/trades/summary error:", e)
+        print("GET /api/analytics error:", e)
         return jsonify({"error": str(e)}), 500
 
 # ===== ENTRY POINT =====
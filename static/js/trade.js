@@ -9,6 +9,8 @@ function normalizeTrades(trades) {
   }));
 }
 
+const TRADE_PAGE_SIZE = 1000;
+
 async function fetchFilteredTrades(filters = {}) {
   const params = new URLSearchParams();
 
@@ -21,10 +23,36 @@ async function fetchFilteredTrades(filters = {}) {
       params.append(key, val);
     }
   });
+  params.set("limit", TRADE_PAGE_SIZE);
+
+  // follow the keyset cursor until an empty page (a short one may just be capped by max-rows)
+  let trades = [];
+  let cursor = null;
+  let page;
+  do {
+    if (cursor) params.set("cursor", cursor);
+    const res = await fetch(`/api/trades?${params.toString()}`);
+    page = await res.json();
+    if (!res.ok) return page;
+    trades = trades.concat(page);
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor && page.length);
+
+  return trades;
+}
 
-  const res = await fetch(`/api/trades?${params.toString()}`);
-  return await res.json();
+// Poll a background job until it finishes; onProgress(job) gets every update
+async function watchJob(jobId, onProgress, intervalMs = 1000) {
+  while (true) {
+    const res = await fetch(`/api/jobs/${jobId}`);
+    if (!res.ok) throw new Error(`Job ${jobId} not found`);
+    const job = await res.json();
+    if (onProgress) onProgress(job);
+    if (job.status === "done" || job.status === "failed") return job;
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
 }
 
 // expose globally (important)
-window.fetchFilteredTrades = fetchFilteredTrades;
\ No newline at end of file
+window.fetchFilteredTrades = fetchFilteredTrades;
+window.watchJob = watchJob;
\ No newline at end of file
@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+DOW_LABELS = ["Mon", "Tue", "Wed", "Thu", "Fri"]
+
+
+def _naive_ts(series):
+    """Stored timestamps are naive local time; keep them that way ("YYYY-MM-DD HH:MM:SS" or ISO)."""
+    return pd.to_datetime(
+        series.astype(str).str.slice(0, 19).str.replace(" ", "T", regex=False),
+        format="%Y-%m-%dT%H:%M:%S",
+        errors="coerce",
+    )
+
+
+def _fmt_minutes(m):
+    return f"{round(m)}m" if m < 60 else f"{int(m // 60)}h {round(m % 60)}m"
+
+
+def tag_mask(trade_ids, links, tag_ids, logic="or"):
+    """
+    Boolean mask over trade_ids: trades linked to any (logic="or") or all
+    (logic="and") of tag_ids, given a (trade_id, tag_id) links DataFrame.
+    """
+    tag_ids = {int(t) for t in tag_ids}
+    if links.empty:
+        return np.zeros(len(trade_ids), dtype=bool)
+    hits   = links[links["tag_id"].isin(tag_ids)].drop_duplicates()
+    counts = hits.groupby("trade_id").size()
+    needed = len(tag_ids) if logic == "and" else 1
+    return trade_ids.map(counts).fillna(0).to_numpy() >= needed
+
+
+def trade_stats(pnl):
+    wins       = pnl[pnl > 0]
+    losses     = pnl[pnl < 0]
+    gross_loss = -losses.sum()
+    return {
+        "trades":        int(len(pnl)),
+        "pnl":           round(float(pnl.sum()), 2),
+        "wins":          int(len(wins)),
+        "losses":        int(len(losses)),
+        "avg_win":       round(float(wins.mean()), 2) if len(wins) else 0.0,
+        "avg_loss":      round(float(losses.mean()), 2) if len(losses) else 0.0,
+        "win_rate":      round(len(wins) / len(pnl) * 100, 1) if len(pnl) else 0.0,
+        "profit_factor": round(float(wins.sum() / gross_loss), 2) if gross_loss > 0 else None,   # None → ∞
+    }
+
+
+def daily_pnl(day, pnl):
+    return pnl.groupby(day).sum().sort_index()
+
+
+def equity_curve(daily):
+    return {
+        "labels": list(daily.index),
+        "data":   daily.cumsum().round(2).tolist(),
+    }
+
+
+def max_drawdown(equity):
+    equity = np.asarray(equity, dtype=float)
+    if not len(equity):
+        return 0.0
+    return round(float((np.maximum.accumulate(equity) - equity).max()), 2)
+
+
+def day_streaks(daily):
+    """Longest run of green / red days; flat days neither extend nor break a run."""
+    signs = np.sign(daily.to_numpy())
+    signs = signs[signs != 0]
+    if not len(signs):
+        return {"best": 0, "worst": 0}
+    run_id  = np.concatenate([[0], np.cumsum(signs[1:] != signs[:-1])])
+    lengths = pd.Series(signs).groupby(run_id).agg(["first", "size"])
+    best    = lengths.loc[lengths["first"] > 0, "size"]
+    worst   = lengths.loc[lengths["first"] < 0, "size"]
+    return {
+        "best":  int(best.max()) if len(best) else 0,
+        "worst": int(worst.max()) if len(worst) else 0,
+    }
+
+
+def duration_stats(entry, exit_):
+    minutes = ((exit_ - entry).dt.total_seconds() / 60).dropna()
+    if minutes.empty:
+        return None
+    return {
+        "avg":   _fmt_minutes(minutes.mean()),
+        "min":   _fmt_minutes(minutes.min()),
+        "max":   _fmt_minutes(minutes.max()),
+        "count": int(len(minutes)),
+    }
+
+
+def hour_scatter(entry, pnl):
+    """
+    Columnar {x, y, n} binned per quarter-hour of entry (at most 96 points):
+    x is the quarter, y its summed P&L and n its trade count.
+    """
+    x    = entry.dt.hour + (entry.dt.minute // 15) * 0.25
+    bins = pnl.groupby(x).agg(["sum", "size"])
+    return {
+        "x": bins.index.tolist(),
+        "y": bins["sum"].round(2).tolist(),
+        "n": bins["size"].astype(int).tolist(),
+    }
+
+
+def dow_win_rate(entry, pnl):
+    dow    = entry.dt.dayofweek
+    keep   = dow < 5
+    totals = dow[keep].value_counts().reindex(range(5), fill_value=0)
+    wins   = dow[keep & (pnl > 0)].value_counts().reindex(range(5), fill_value=0)
+    rate   = (wins / totals.replace(0, np.nan) * 100).round(1).fillna(0)
+    return {
+        "labels": DOW_LABELS,
+        "data":   rate.tolist(),
+        "counts": totals.astype(int).tolist(),
+    }
+
+
+def compute_analytics(trades, year, month):
+    """
+    Dashboard metrics for a (tag-filtered) trade set.
+
+    `trades` is a DataFrame with entryTimestamp, exitTimestamp and pnl;
+    `month` is 1-12. Everything is aggregated per day / weekday / trade, so
+    the payload does not carry the trades themselves.
+    """
+    trades = trades.reset_index(drop=True)
+    pnl    = pd.to_numeric(trades["pnl"], errors="coerce").fillna(0.0).astype(float)
+    entry  = _naive_ts(trades["entryTimestamp"])
+    exit_  = _naive_ts(trades["exitTimestamp"])
+    day    = entry.dt.strftime("%Y-%m-%d")
+
+    in_year  = (entry.dt.year == year).to_numpy()
+    in_month = in_year & (entry.dt.month == month).to_numpy()
+
+    account_daily = daily_pnl(day, pnl)
+    year_daily    = daily_pnl(day[in_year], pnl[in_year])
+    month_daily   = daily_pnl(day[in_month], pnl[in_month])
+    month_counts  = day[in_month].value_counts()
+
+    account_equity = equity_curve(account_daily)
+
+    return {
+        "month": {
+            **trade_stats(pnl[in_month]),
+            "equity": equity_curve(month_daily),
+            "daily":  {d: {"trades": int(month_counts[d]), "pnl": round(float(v), 2)} for d, v in month_daily.items()},
+        },
+        "year": {
+            **trade_stats(pnl[in_year]),
+            "equity": equity_curve(year_daily),
+            "daily":  {d: round(float(v), 2) for d, v in year_daily.items()},
+        },
+        "account": {
+            **trade_stats(pnl),
+            "max_drawdown": max_drawdown(account_equity["data"]),
+            "streaks":      day_streaks(account_daily),
+            "duration":     duration_stats(entry, exit_),
+            "hour_scatter": hour_scatter(entry, pnl),
+            "dow":          dow_win_rate(entry, pnl),
+        },
+    }
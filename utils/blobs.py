@@ -0,0 +1,76 @@
+import hashlib
+import os
+import re
+import time
+import uuid
+
+KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def blob_key(data):
+    """Content address of some bytes (hex sha256)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed binary store on local disk.
+
+    A blob lives at <root>/<key[:2]>/<key>, its key being the sha256 of its
+    bytes, so the same image is only ever written once and a key always
+    names the same content (safe to cache forever). Blobs are never
+    rewritten; a new render is a new key, and the caller deletes a key once
+    nothing references it any more.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, data):
+        """Store `data` unless it is already there; returns its key."""
+        key  = blob_key(data)
+        path = self._path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        else:
+            # a fresh reference is about to be stored: keep delete() off it
+            os.utime(path)
+        return key
+
+    def get(self, key):
+        """The blob's bytes, or None for a malformed or unknown key."""
+        if not key or not KEY_PATTERN.fullmatch(key):
+            return None
+        try:
+            with open(self._path(key), "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key):
+        return bool(key) and bool(KEY_PATTERN.fullmatch(key)) and os.path.exists(self._path(key))
+
+    def delete(self, key, grace=0):
+        """
+        Remove a blob nothing references any more. One put() within the last
+        `grace` seconds is kept, since the row referencing it may not be
+        stored yet. True when the blob was removed.
+        """
+        if not self.exists(key):
+            return False
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) < grace:
+                return False
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
@@ -0,0 +1,221 @@
+import csv
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils.functions import CSV_COLUMNS, CSV_CHUNK_ROWS, csv_handler
+
+
+# Bounds on what an uploaded zip may expand to, checked before anything is read
+ZIP_MAX_ENTRIES      = 1000
+ZIP_MAX_MEMBERS      = 100                  # CSV members
+ZIP_MAX_MEMBER_BYTES = 100 * 1024 * 1024    # uncompressed, per member
+ZIP_MAX_TOTAL_BYTES  = 256 * 1024 * 1024    # uncompressed, all members of all archives
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def _money(value):
+    # "$(1,250.00)" → -1250.0 in one translate pass
+    return float(value.translate(_MONEY_TABLE)) if value else 0.0
+
+
+_MONEY_TABLE = str.maketrans({"$": None, ",": None, "(": "-", ")": None})
+
+
+class BrokerAdapter:
+    """
+    How one broker's fill export maps onto the app's fill columns.
+
+    `signature` is the set of header columns that identifies the format;
+    `dtype`, `converters` and `timestamps` are handed to read_csv so every
+    column comes out typed from the parser itself. Subclasses rename
+    `columns` to CSV_COLUMNS names and override to_fills() for anything
+    the parser cannot express.
+    """
+
+    name       = None
+    signature  = frozenset()
+    columns    = {}           # export column → fill column
+    dtype      = {}
+    converters = {}
+    timestamps = {}           # export column → strptime format
+
+    def matches(self, header):
+        return self.signature <= set(header)
+
+    def read(self, file, chunksize=CSV_CHUNK_ROWS):
+        """The export as typed chunks already in CSV_COLUMNS shape."""
+        formats = set(self.timestamps.values())
+        try:
+            reader = pd.read_csv(
+                file,
+                usecols=list(self.columns),
+                dtype=self.dtype,
+                converters=self.converters,
+                parse_dates=list(self.timestamps),
+                date_format=formats.pop() if len(formats) == 1 else self.timestamps,
+                chunksize=chunksize,
+            )
+            for chunk in reader:
+                chunk = chunk.rename(columns=self.columns)
+                for column, fmt in self.timestamps.items():
+                    column = self.columns[column]
+                    if not pd.api.types.is_datetime64_any_dtype(chunk[column]):
+                        # the parser leaves a column as text when a value does not fit
+                        chunk[column] = pd.to_datetime(chunk[column], format=fmt)
+                yield self.to_fills(chunk)[CSV_COLUMNS]
+        except ValueError as e:
+            # header matched the signature but a column is missing, or a value does not parse
+            raise UnsupportedFormat(f"Unreadable {self.name} export: {e}")
+
+    def to_fills(self, chunk):
+        return chunk
+
+
+class TradovateAdapter(BrokerAdapter):
+    """Tradovate "Performance" report: one row per buy/sell fill pair."""
+
+    name      = "tradovate"
+    signature = frozenset({"buyFillId", "sellFillId", "boughtTimestamp", "soldTimestamp", "pnl"})
+    columns   = {c: c for c in CSV_COLUMNS}
+    dtype     = {
+        "symbol":     str,
+        "buyFillId":  "Int64",
+        "sellFillId": "Int64",
+        "qty":        "int64",
+        "buyPrice":   "float64",
+        "sellPrice":  "float64",
+        "duration":   str,
+    }
+    converters = {"pnl": _money}
+    timestamps = {
+        "boughtTimestamp": "%m/%d/%Y %H:%M:%S",
+        "soldTimestamp":   "%m/%d/%Y %H:%M:%S",
+    }
+
+    def to_fills(self, chunk):
+        # "ESM4" → "ES": drop the contract month and year
+        chunk["symbol"] = chunk["symbol"].str[:-2].str.upper()
+        return chunk
+
+
+ADAPTERS = [TradovateAdapter()]
+
+
+def register(adapter):
+    ADAPTERS.append(adapter)
+    return adapter
+
+
+def detect(file):
+    """The adapter whose signature matches the file's header; the file is rewound."""
+    first = file.readline()
+    file.seek(0)
+    if isinstance(first, bytes):
+        first = first.decode("utf-8-sig", errors="replace")
+    header = [c.strip() for c in next(csv.reader(io.StringIO(first)), [])]
+    for adapter in ADAPTERS:
+        if adapter.matches(header):
+            return adapter
+    raise UnsupportedFormat(f"Unrecognised export format (columns: {', '.join(header[:8]) or 'none'})")
+
+
+def read_csv_chunks(file, chunksize=CSV_CHUNK_ROWS):
+    """Detect the broker and stream its export as typed chunks for csv_handler."""
+    return detect(file).read(file, chunksize)
+
+
+def expand_uploads(files):
+    """
+    (name, bytes) for every CSV in the uploaded files, zip archives opened
+    up; anything else inside an archive (folders, __MACOSX, readmes) is ignored.
+    Archives beyond the ZIP_MAX_* bounds are rejected before they are inflated.
+    """
+    members  = []
+    expanded = 0
+    for file in files:
+        name = file.filename or "upload"
+        data = file.read()
+        if name.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile:
+                raise UnsupportedFormat(f"{name}: not a valid zip archive")
+            with archive:
+                infos = archive.infolist()
+                if len(infos) > ZIP_MAX_ENTRIES:
+                    raise UnsupportedFormat(f"{name}: more than {ZIP_MAX_ENTRIES} entries")
+                for info in infos:
+                    base = os.path.basename(info.filename)
+                    if info.is_dir() or base.startswith(".") or "__MACOSX" in info.filename:
+                        continue
+                    if not base.lower().endswith(".csv"):
+                        continue
+                    # zipfile never inflates a member past its declared file_size
+                    expanded += info.file_size
+                    if info.file_size > ZIP_MAX_MEMBER_BYTES:
+                        raise UnsupportedFormat(f"{name}/{info.filename}: larger than {ZIP_MAX_MEMBER_BYTES >> 20} MB uncompressed")
+                    if expanded > ZIP_MAX_TOTAL_BYTES:
+                        raise UnsupportedFormat(f"{name}: more than {ZIP_MAX_TOTAL_BYTES >> 20} MB uncompressed")
+                    if len(members) >= ZIP_MAX_MEMBERS:
+                        raise UnsupportedFormat(f"{name}: more than {ZIP_MAX_MEMBERS} CSV files")
+                    members.append((f"{name}/{info.filename}", archive.read(info)))
+        elif name.lower().endswith(".csv"):
+            members.append((name, data))
+        else:
+            raise UnsupportedFormat(f"{name}: only CSV or zip files are accepted")
+    return members
+
+
+def _parse_member(name, data, df_fees):
+    """Worker side: one export → its normalised fills (csv_handler applied)."""
+    try:
+        frames = [csv_handler(chunk, df_fees) for chunk in read_csv_chunks(io.BytesIO(data))]
+    except UnsupportedFormat as e:
+        raise UnsupportedFormat(f"{name}: {e}")
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+class ExportParser:
+    """Parses several broker exports at once on a pool of worker processes."""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool       = None
+        self._lock       = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers = self.max_workers,
+                    mp_context  = multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def parse_many(self, members, df_fees=None):
+        """Yield each member's normalised fills, in the order given; a lone member is parsed inline."""
+        if len(members) == 1:
+            frame = _parse_member(*members[0], df_fees)
+            if frame is not None:
+                yield frame
+            return
+        futures = [self._executor().submit(_parse_member, name, data, df_fees) for name, data in members]
+        for future in futures:
+            frame = future.result()
+            if frame is not None:
+                yield frame
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,220 @@
+import os
+import re
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils.yahoo import fetch_chart, chart_result, YahooError
+
+# One structured array per (symbol, interval, UTC day), stored as .npy so reads
+# can be memory-mapped instead of parsed.
+CANDLE_DTYPE = np.dtype([
+    ("ts",     "<i8"),
+    ("open",   "<f8"),
+    ("high",   "<f8"),
+    ("low",    "<f8"),
+    ("close",  "<f8"),
+    ("volume", "<f8"),
+])
+
+# Largest window Yahoo accepts in a single request, per interval
+MAX_SPAN_DAYS = {
+    "1m": 7, "2m": 60, "5m": 60, "15m": 60, "30m": 60,
+    "60m": 730, "90m": 60, "1h": 730, "1d": 3650,
+}
+
+# How many days back Yahoo serves each interval at all (None: no limit)
+HISTORY_DAYS = {
+    "1m": 30, "2m": 60, "5m": 60, "15m": 60, "30m": 60,
+    "60m": 730, "90m": 60, "1h": 730, "1d": None,
+}
+
+# Symbols may only be made of these, so a symbol can never name a path outside the store
+SYMBOL_PATTERN = re.compile(r"[A-Za-z0-9^][A-Za-z0-9.^=_-]{0,31}")
+
+# A day is only persisted once it is over (plus a margin for late bars);
+# until then it is fetched on demand and never written to disk.
+SETTLE_DELAY = timedelta(minutes=30)
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def settled(day, now=None):
+    """True once a UTC day is over and Yahoo has had SETTLE_DELAY to finalise its bars."""
+    now = now or datetime.now(timezone.utc)
+    return _day_start(day + timedelta(days=1)) + SETTLE_DELAY <= now
+
+
+def first_served_day(interval, today=None):
+    """Oldest UTC day Yahoo still has `interval` bars for (date.min when unlimited)."""
+    days = HISTORY_DAYS.get(interval)
+    if days is None:
+        return date.min
+    today = today or datetime.now(timezone.utc).date()
+    return today - timedelta(days=days - 1)
+
+
+def _day_range(start_day, end_day):
+    return [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+
+
+def _contiguous_runs(days, max_span):
+    """[d1, d2, d3, d7, d8] → [(d1, d3), (d7, d8)], each run at most max_span days long."""
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][1] == timedelta(days=1) and (day - runs[-1][0]).days < max_span:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(r) for r in runs]
+
+
+def to_frame(arr):
+    """Structured candle array → OHLCV DataFrame indexed by UTC timestamps."""
+    return pd.DataFrame({
+        "Open":   arr["open"],
+        "High":   arr["high"],
+        "Low":    arr["low"],
+        "Close":  arr["close"],
+        "Volume": arr["volume"],
+    }, index=pd.to_datetime(arr["ts"], unit="s", utc=True))
+
+
+def resample(arr, seconds):
+    """
+    Aggregate a time-sorted candle array into `seconds`-wide bars aligned on
+    the UTC epoch: first open, highest high, lowest low, last close, summed volume.
+    """
+    if len(arr) == 0:
+        return arr
+    bucket = arr["ts"] // seconds * seconds
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends   = np.r_[starts[1:], len(arr)] - 1
+
+    out = np.empty(len(starts), dtype=CANDLE_DTYPE)
+    out["ts"]     = bucket[starts]
+    out["open"]   = arr["open"][starts]
+    out["high"]   = np.maximum.reduceat(arr["high"], starts)
+    out["low"]    = np.minimum.reduceat(arr["low"], starts)
+    out["close"]  = arr["close"][ends]
+    out["volume"] = np.add.reduceat(arr["volume"], starts)
+    return out
+
+
+def to_yahoo_payload(symbol, interval, arr):
+    """Structured candle array → the subset of Yahoo's chart JSON the front-end reads."""
+    return {
+        "chart": {
+            "result": [{
+                "meta":      {"symbol": symbol, "dataGranularity": interval},
+                "timestamp": arr["ts"].tolist(),
+                "indicators": {"quote": [{
+                    "open":   arr["open"].tolist(),
+                    "high":   arr["high"].tolist(),
+                    "low":    arr["low"].tolist(),
+                    "close":  arr["close"].tolist(),
+                    "volume": arr["volume"].tolist(),
+                }]},
+            }],
+            "error": None,
+        }
+    }
+
+
+class CandleStore:
+    """
+    Persistent OHLC cache keyed by (symbol, interval, UTC trading day).
+
+    Missing days are fetched from Yahoo in as few requests as possible and
+    written once; completed days never change, so later reads are served
+    straight from disk.
+    """
+
+    def __init__(self, root, fetcher=fetch_chart):
+        self.root    = root
+        self.fetcher = fetcher
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, symbol, interval, day):
+        if interval not in MAX_SPAN_DAYS or not SYMBOL_PATTERN.fullmatch(symbol):
+            raise ValueError(f"Invalid candle series: {symbol!r} {interval!r}")
+        return os.path.join(self.root, symbol, interval, f"{day.isoformat()}.npy")
+
+    def _write(self, path, arr):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as fh:
+            np.save(fh, arr)
+        os.replace(tmp, path)
+
+    def _fetch(self, symbol, interval, first_day, last_day):
+        data   = self.fetcher(
+            symbol, interval,
+            period1=_day_start(first_day).timestamp(),
+            period2=_day_start(last_day + timedelta(days=1)).timestamp(),
+        )
+        try:
+            result = chart_result(data)
+        except YahooError:
+            # No data at all for the window (e.g. only weekend days)
+            if data.get("chart", {}).get("error") is None:
+                return np.empty(0, dtype=CANDLE_DTYPE)
+            raise
+
+        timestamps = result.get("timestamp") or []
+        quote      = result["indicators"]["quote"][0]
+        n          = len(timestamps)
+
+        arr = np.empty(n, dtype=CANDLE_DTYPE)
+        arr["ts"] = timestamps
+        for field in ("open", "high", "low", "close"):
+            arr[field] = np.array(quote.get(field) or [None] * n, dtype="f8")
+        arr["volume"] = np.nan_to_num(np.array(quote.get("volume") or [0] * n, dtype="f8"))
+
+        valid = ~np.isnan(arr["open"]) & ~np.isnan(arr["high"]) & ~np.isnan(arr["low"]) & ~np.isnan(arr["close"])
+        arr   = arr[valid]
+        return arr[np.argsort(arr["ts"], kind="stable")]
+
+    def _fill(self, symbol, interval, days, now):
+        """Fetch `days` from Yahoo; persist the completed ones and return all of them."""
+        fetched = {}
+        for first, last in _contiguous_runs(days, MAX_SPAN_DAYS.get(interval, 60)):
+            arr = self._fetch(symbol, interval, first, last)
+            day_of_bar = arr["ts"] // 86400
+            for day in _day_range(first, last):
+                day_arr      = arr[day_of_bar == day.toordinal() - _EPOCH_ORDINAL]
+                fetched[day] = day_arr
+                if settled(day, now):
+                    self._write(self._path(symbol, interval, day), day_arr)
+        return fetched
+
+    def candles(self, symbol, interval, start_day, end_day):
+        """Structured array of every bar between two UTC days (inclusive), filling gaps first."""
+        now  = datetime.now(timezone.utc)
+        days = [d for d in _day_range(start_day, end_day) if _day_start(d) <= now]
+
+        chunks  = {}
+        missing = []
+        for day in days:
+            path = self._path(symbol, interval, day)
+            if os.path.exists(path):
+                chunks[day] = np.load(path, mmap_mode="r")
+            else:
+                missing.append(day)
+
+        # days Yahoo no longer serves at this interval would fail the whole run
+        missing = [d for d in missing if d >= first_served_day(interval, now.date())]
+        if missing:
+            chunks.update(self._fill(symbol, interval, missing, now))
+
+        parts = [chunks[d] for d in sorted(chunks) if len(chunks[d])]
+        if not parts:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return np.concatenate(parts)
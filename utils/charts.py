@@ -0,0 +1,570 @@
+import io
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import matplotlib
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import mplfinance as mpf
+import numpy as np
+import pandas as pd
+
+from utils.candles import first_served_day, resample, settled, to_frame
+from utils.yahoo import yahoo_symbol
+
+# ── Timeframes ──────────────────────────────────────────────────────────────
+# Charts are drawn from a native Yahoo series resampled locally, so any
+# "<n>m" / "<n>h" / "<n>d" (or "D") timeframe can be rendered. Each timeframe
+# gets its own base series, limited to the history Yahoo keeps for it.
+YAHOO_INTERVALS = [           # native interval, seconds — finest first
+    ("1m", 60), ("2m", 120), ("5m", 300), ("15m", 900), ("30m", 1800), ("60m", 3600), ("1d", 86400),
+]
+TIMEFRAME_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+# Upper bound in seconds → days of history loaded before the trade (MAs need it)
+LOOKBACK_DAYS = [
+    (60, 1), (300, 5), (900, 10), (1800, 15), (3600, 30), (14400, 60), (86400, 90),
+]
+# Upper bound in seconds → hours shown (before entry, after exit)
+CONTEXT_HOURS = [
+    (60, (2, 3)),     (180, (3, 4)),     (300, (4, 5)),     (900, (8, 10)),
+    (1800, (16, 20)), (3600, (24, 48)),  (14400, (72, 120)), (86400, (720, 1440)),
+]
+
+
+def timeframe_seconds(timeframe):
+    """"3m" → 180, "4h" → 14400, "D" → 86400; ValueError for anything else."""
+    tf = str(timeframe).strip()
+    if tf.upper() == "D":
+        return 86400
+    count, unit = tf[:-1], tf[-1:].lower()
+    if unit not in TIMEFRAME_UNITS or not count.isdigit() or int(count) <= 0:
+        raise ValueError(f"Unsupported timeframe: {timeframe!r}")
+    seconds = int(count) * TIMEFRAME_UNITS[unit]
+    if seconds % 60 or (seconds > 86400 and seconds % 86400):
+        raise ValueError(f"Unsupported timeframe: {timeframe!r}")
+    return seconds
+
+
+def parse_timeframes(value):
+    """"1m,5m,15m" or ["1m", "5m"] → validated, de-duplicated list in the order given."""
+    items = value.split(",") if isinstance(value, str) else list(value or [])
+    timeframes = []
+    for tf in (str(t).strip() for t in items):
+        timeframe_seconds(tf)
+        if tf and tf not in timeframes:
+            timeframes.append(tf)
+    if not timeframes:
+        raise ValueError("No timeframe given")
+    return timeframes
+
+
+def _bounded(table, seconds):
+    for bound, value in table:
+        if seconds <= bound:
+            return value
+    return table[-1][1]
+
+
+def base_interval(seconds, trade_date, today=None):
+    """
+    Native Yahoo interval a `seconds` timeframe is drawn from for a trade on
+    `trade_date`: the coarsest one that divides it evenly and that Yahoo
+    still serves for that day, else None (a base that does not divide the
+    timeframe would give bars of uneven width).
+    """
+    exact = [
+        interval for interval, step in YAHOO_INTERVALS
+        if seconds % step == 0 and trade_date >= first_served_day(interval, today)
+    ]
+    return exact[-1] if exact else None
+
+
+MA_TYPE_MAP = {1: "SMA", 2: "EMA"}
+
+# Bump whenever the drawing itself changes, so every stored chart is stale
+RENDER_VERSION = 1
+# The settings a chart is drawn with
+RENDER_SETTINGS = (
+    "timezone",
+    "MA1_activ", "MA1_type", "MA1_value",
+    "MA2_activ", "MA2_type", "MA2_value",
+    "VWAP_activ",
+)
+
+_style = None
+
+
+def chart_style():
+    """The custom candle style, built once per process."""
+    global _style
+    if _style is None:
+        _style = mpf.make_mpf_style(
+            base_mpf_style="charles",
+            marketcolors=mpf.make_marketcolors(
+                up   = "#D1D1D1",
+                down = "#7E838C",
+                edge = {"up": "#7E838C", "down": "#7E838C"},
+                wick = {"up": "#7E838C", "down": "#7E838C"},
+                ohlc = "inherit",
+                volume = {"up": "#D1D1D1", "down": "#7E838C"},
+            ),
+            facecolor = "#ffffff",
+            figcolor  = "#ffffff",
+            gridcolor = "#e0e0e0",
+            gridstyle = "--",
+            gridaxis  = "both",
+        )
+    return _style
+
+
+def candle_windows(symbol, entry_time, timeframes, today=None):
+    """
+    {(yahoo symbol, base interval, first day, last day): [timeframes]} — the
+    candle series a trade's `timeframes` are resampled from, one per base
+    interval. Lookback stops at the oldest day Yahoo serves that interval;
+    timeframes with no usable base series are left out.
+    """
+    today      = today or datetime.now(timezone.utc).date()
+    trade_date = entry_time.date()
+
+    groups = {}
+    for tf in timeframes:
+        seconds  = timeframe_seconds(tf)
+        interval = base_interval(seconds, trade_date, today)
+        if interval is not None:
+            groups.setdefault(interval, []).append((tf, seconds))
+
+    windows = {}
+    for interval, members in groups.items():
+        lookback = max(_bounded(LOOKBACK_DAYS, s) for _, s in members)
+        first    = max(trade_date - timedelta(days=lookback), first_served_day(interval, today))
+        windows[(yahoo_symbol(symbol), interval, first, trade_date + timedelta(days=1))] = [tf for tf, _ in members]
+    return windows
+
+
+def _localize(ts, tz):
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize(tz) if ts.tzinfo is None else ts.tz_convert(tz)
+
+
+def _to_bool(v):
+    return v in [True, "true", "True", 1, "1"]
+
+
+def _to_int(v):
+    try:
+        return int(float(v)) if v is not None else None
+    except:
+        return None
+
+
+def _ma_configs(settings):
+    """The enabled moving averages as (column name, type, length)."""
+    configs = []
+    for n in (1, 2):
+        value = _to_int(settings.get(f"MA{n}_value"))
+        if not _to_bool(settings.get(f"MA{n}_activ")) or not value or value <= 0:
+            continue
+        ma_type = MA_TYPE_MAP.get(_to_int(settings.get(f"MA{n}_type")), "EMA")
+        configs.append((f"{ma_type}_{value}", ma_type, value))
+    return configs
+
+
+def _vwap(df):
+    """Session VWAP (reset every local day) of an OHLCV frame."""
+    typical_price = (df["High"] + df["Low"] + df["Close"]) / 3
+    day           = df.index.date
+    cum_tp_vol    = (typical_price * df["Volume"]).groupby(day).cumsum()
+    cum_vol       = df["Volume"].groupby(day).cumsum().replace(0, float("nan"))
+    return (cum_tp_vol / cum_vol).ffill()
+
+
+def _marker_layers(n, bars, prices):
+    """
+    Marker prices laid out on n bars (NaN elsewhere). One array holds every
+    marker; a further one is only needed where different prices share a bar.
+    """
+    pairs = np.unique(np.column_stack([np.asarray(bars, float), np.asarray(prices, float)]), axis=0)
+    layers = []
+    while len(pairs):
+        bar_idx, first = np.unique(pairs[:, 0].astype(np.int64), return_index=True)
+        layer = np.full(n, np.nan)
+        layer[bar_idx] = pairs[first, 1]
+        layers.append(layer)
+        pairs = np.delete(pairs, first, axis=0)
+    return layers
+
+
+class TradeChart:
+    """
+    Everything about one trade's chart that does not depend on the bar size,
+    worked out once from a base candle array: the localised trade and fill
+    times, the marker prices and the VWAP (computed on the base bars and read
+    back at each bar's close). frame() then gives the trimmed OHLCV frame
+    with its indicator columns for any timeframe.
+    """
+
+    def __init__(self, candles, entry_time, exit_time, entry_price, exit_price, side, settings, fills=None):
+        self.candles  = np.asarray(candles)
+        self.timezone = settings.get("timezone", "Europe/Paris")
+
+        # ── Localize trade-level entry/exit (used for chart window) ─────
+        self.entry_ts = _localize(entry_time, self.timezone)
+        self.exit_ts  = _localize(exit_time, self.timezone)
+
+        self.is_long     = str(side).lower() == "long"
+        self.entry_color = "#26a666" if self.is_long else "#ef5350"
+        self.exit_color  = "#ef5350" if self.is_long else "#26a666"
+
+        # ── Per-fill markers: (entry ts, entry px, exit ts, exit px) ────
+        def parse_fill_ts(raw):
+            # strip microseconds, treat as naive local time
+            return _localize(str(raw).split(".")[0], self.timezone)
+
+        self.markers = []
+        if fills:
+            for fill in fills:
+                try:
+                    # Resolve which timestamp/price is entry vs exit per side
+                    if self.is_long:
+                        self.markers.append((parse_fill_ts(fill["bought_timestamp"]), float(fill["buy_price"]),
+                                             parse_fill_ts(fill["sold_timestamp"]),   float(fill["sell_price"])))
+                    else:
+                        self.markers.append((parse_fill_ts(fill["sold_timestamp"]),   float(fill["sell_price"]),
+                                             parse_fill_ts(fill["bought_timestamp"]), float(fill["buy_price"])))
+                except Exception as e:
+                    print(f"Marker error for fill: {e}")
+            self.marker_size = 90
+        else:
+            # ── Fallback: single marker for legacy trades without fills ──
+            self.markers     = [(self.entry_ts, float(entry_price), self.exit_ts, float(exit_price))]
+            self.marker_size = 120
+
+        self.ma_configs = _ma_configs(settings)
+
+        # ── VWAP once, on the finest bars available ─────────────────────
+        self.base_vwap = None
+        if _to_bool(settings.get("VWAP_activ")) and len(self.candles):
+            self.base_vwap = _vwap(to_frame(self.candles).tz_convert(self.timezone)).to_numpy()
+
+    def frame(self, timeframe):
+        """Trimmed OHLCV frame with MA/VWAP columns at `timeframe`, or None when too short."""
+        seconds = timeframe_seconds(timeframe)
+        bars    = resample(self.candles, seconds)
+        df      = to_frame(bars).tz_convert(self.timezone)
+
+        if len(df) < 5:
+            print(f"Insufficient candles: {len(df)}")
+            return None
+
+        # ── 1. Compute MAs on FULL df (needs max history) ───────────────
+        for column, ma_type, length in self.ma_configs:
+            if ma_type == "SMA":
+                df[column] = df["Close"].rolling(length).mean()
+            else:
+                df[column] = df["Close"].ewm(span=length, adjust=False).mean()
+
+        # ── 2. VWAP of the last base bar inside each bar ────────────────
+        if self.base_vwap is not None:
+            closing = pd.Series(self.base_vwap, index=self.candles["ts"] // seconds * seconds).groupby(level=0).last()
+            df["VWAP"] = closing.reindex(bars["ts"]).to_numpy()
+
+        # ── 3. Trim to trade window ──────────────────────────────────────
+        ctx_before, ctx_after = _bounded(CONTEXT_HOURS, seconds)
+        df = df[
+            (df.index >= self.entry_ts - timedelta(hours=ctx_before)) &
+            (df.index <= self.exit_ts  + timedelta(hours=ctx_after))
+        ]
+
+        if df.empty or len(df) < 5:
+            print("No candles in trade window")
+            return None
+        return df
+
+    def marker_bars(self, df):
+        """Nearest bar of every marker's entry and exit in a trimmed frame."""
+        entries = df.index.get_indexer([m[0] for m in self.markers], method="nearest")
+        exits   = df.index.get_indexer([m[2] for m in self.markers], method="nearest")
+        return entries, exits
+
+    def render(self, timeframe):
+        """One timeframe as PNG bytes, or None."""
+        df = self.frame(timeframe)
+        if df is None:
+            return None
+
+        # ── 4. Build addplots AFTER trim ─────────────────────────────────
+        apds = [mpf.make_addplot(df[column], width=1.2) for column, _, _ in self.ma_configs]
+        if "VWAP" in df.columns:
+            apds.append(mpf.make_addplot(df["VWAP"], width=1.2, color="#d47bfd"))
+
+        # ── 5. Markers at the nearest bar: one scatter series per side ───
+        entries, exits = self.marker_bars(df)
+        for layer in _marker_layers(len(df), entries, [m[1] for m in self.markers]):
+            apds.append(mpf.make_addplot(
+                layer, type="scatter", markersize=self.marker_size,
+                marker="^" if self.is_long else "v", color=self.entry_color
+            ))
+        for layer in _marker_layers(len(df), exits, [m[3] for m in self.markers]):
+            apds.append(mpf.make_addplot(
+                layer, type="scatter", markersize=self.marker_size,
+                marker="v" if self.is_long else "^", color=self.exit_color
+            ))
+
+        # ── 6. Hlines: one per unique price level ────────────────────────
+        all_entry_prices = {m[1] for m in self.markers}
+        all_exit_prices  = {m[3] for m in self.markers}
+        hlines = dict(
+            hlines=list(all_entry_prices) + list(all_exit_prices),
+            colors=[self.entry_color] * len(all_entry_prices) + [self.exit_color] * len(all_exit_prices),
+            linestyle="--", linewidths=0.8
+        )
+
+        # ── 7. Plot with the process-wide candle style ───────────────────
+        fig, axes = mpf.plot(
+            df,
+            type="candle",
+            style=chart_style(),
+            addplot=apds,
+            hlines=hlines,
+            tight_layout=True,
+            figsize=(10, 5),
+            returnfig=True
+        )
+
+        # ── 8. Watermark ─────────────────────────────────────────────────
+        axes[0].text(
+            0.02, 0.02,
+            timeframe,
+            transform=axes[0].transAxes,
+            fontsize=18,
+            color="#b0b0b0",
+            alpha=0.6,
+            ha="left",
+            va="bottom",
+            fontweight="bold"
+        )
+
+        # Skip the PNG "Software" text chunk
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=100, metadata={"Software": None})
+        plt.close(fig)
+        return buf.getvalue()
+
+    def data(self, timeframe):
+        """
+        The trimmed chart as columnar JSON for the browser, or None:
+        bar times (epoch seconds) and OHLCV, each indicator series, the fill
+        markers (bar index + price) and the entry/exit price levels.
+        """
+        df = self.frame(timeframe)
+        if df is None:
+            return None
+
+        def column(values, digits=4):
+            # NaN (indicator warm-up) → null
+            return [None if np.isnan(v) else round(float(v), digits) for v in values]
+
+        entries, exits = self.marker_bars(df)
+        indicators     = [c for c, _, _ in self.ma_configs] + (["VWAP"] if "VWAP" in df.columns else [])
+        return {
+            "timeframe": timeframe,
+            "timezone":  self.timezone,
+            "side":      "long" if self.is_long else "short",
+            "t":         (df.index.asi8 // 10**9).tolist(),
+            "o":         column(df["Open"].to_numpy()),
+            "h":         column(df["High"].to_numpy()),
+            "l":         column(df["Low"].to_numpy()),
+            "c":         column(df["Close"].to_numpy()),
+            "v":         column(df["Volume"].to_numpy(), 0),
+            "series":    {name: column(df[name].to_numpy()) for name in indicators},
+            "markers": {
+                "entry": {"bar": entries.tolist(), "price": [m[1] for m in self.markers]},
+                "exit":  {"bar": exits.tolist(),   "price": [m[3] for m in self.markers]},
+            },
+            "levels": {
+                "entry": sorted({m[1] for m in self.markers}),
+                "exit":  sorted({m[3] for m in self.markers}),
+            },
+        }
+
+
+def render_charts(series, entry_time, exit_time, entry_price, exit_price, side, settings, fills=None):
+    """
+    Render one trade from each (base candle array, timeframes) pair in
+    `series`, every timeframe resampled from its own base; returns
+    {timeframe: PNG bytes or None}.
+    """
+    charts = {}
+    for candles, timeframes in series:
+        charts.update(dict.fromkeys(timeframes))
+        try:
+            chart = TradeChart(candles, entry_time, exit_time, entry_price, exit_price, side, settings, fills)
+        except Exception:
+            print("Chart generation failed")
+            print(traceback.format_exc())
+            continue
+
+        for timeframe in timeframes:
+            try:
+                charts[timeframe] = chart.render(timeframe)
+            except Exception:
+                print(f"Chart generation failed ({timeframe})")
+                print(traceback.format_exc())
+    return charts
+
+
+def _fill_time(raw):
+    # "2024-03-06 10:00:00", "2024-03-06T10:00:00.000" → one spelling
+    return pd.Timestamp(str(raw).split(".")[0]).isoformat()
+
+
+def render_fingerprint(job, timeframe):
+    """
+    Hash of everything a chart job's `timeframe` chart is drawn from: the
+    trade window, prices and side, its fill markers, the chart settings and
+    whether the candles it used were final. Equal fingerprints mean an
+    identical chart, so the render can be skipped.
+    """
+    settings = job.get("settings") or {}
+    fills    = sorted(
+        (_fill_time(f["bought_timestamp"]), _fill_time(f["sold_timestamp"]), float(f["buy_price"]), float(f["sell_price"]))
+        for f in job.get("fills") or []
+    )
+    inputs = [
+        RENDER_VERSION,
+        job["symbol"],
+        job["entry_time"].isoformat(),
+        job["exit_time"].isoformat(),
+        float(job["entry_price"]),
+        float(job["exit_price"]),
+        str(job["side"]).lower(),
+        timeframe,
+        fills,
+        {k: str(settings.get(k)) for k in RENDER_SETTINGS},
+        # a chart drawn while its last day was still trading is redrawn once it settles
+        settled(job["entry_time"].date() + timedelta(days=1)),
+    ]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+# ===== PROCESS POOL =====
+def _init_worker():
+    """Pool initializer: pay for matplotlib/mplfinance setup once per worker."""
+    matplotlib.use("Agg")
+    chart_style()
+
+
+def job_timeframes(job):
+    """The timeframes a chart job asks for, primary first."""
+    return list(job.get("timeframes") or [job.get("timeframe", "5m")])
+
+
+def _render_job(job, series):
+    # timeframes left out of `series` (no data for them) come back as None
+    charts = dict.fromkeys(job_timeframes(job))
+    charts.update(render_charts(
+        series      = series,
+        entry_time  = job["entry_time"],
+        exit_time   = job["exit_time"],
+        entry_price = job["entry_price"],
+        exit_price  = job["exit_price"],
+        side        = job["side"],
+        settings    = job["settings"],
+        fills       = job.get("fills"),
+    ))
+    return job["trade_id"], charts
+
+
+class ChartEngine:
+    """
+    Fans chart renders out to a pool of worker processes.
+
+    Candles are resolved in the calling process and shipped to the workers
+    with each job, so the workers never touch the network or the database.
+    Timeframes drawn from the same base interval for the same symbol and day
+    share one series, fetched once; a job asking for several timeframes is
+    rendered in a single worker call that resamples each from its base. A
+    series that cannot be fetched only fails the timeframes drawn from it.
+    """
+
+    def __init__(self, store, max_workers=None):
+        self.store       = store
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool       = None
+        self._lock       = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers = self.max_workers,
+                    mp_context  = multiprocessing.get_context("spawn"),
+                    initializer = _init_worker,
+                )
+            return self._pool
+
+    def render_many(self, jobs):
+        """
+        Render every job and yield (trade_id, {timeframe: PNG bytes or None}) as each one finishes.
+
+        A job is a dict with trade_id, symbol, entry_time, exit_time,
+        entry_price, exit_price, side, settings, optional fills and either
+        a timeframe or a list of timeframes.
+        """
+        jobs  = list(jobs)
+        today = datetime.now(timezone.utc).date()
+
+        # one series per symbol, base interval and trade day, reaching back as
+        # far as the job on that day that needs the most history
+        plans = {}
+        first = {}
+        for job in jobs:
+            plans[id(job)] = candle_windows(job["symbol"], job["entry_time"], job_timeframes(job), today)
+            for symbol, interval, start, end in plans[id(job)]:
+                key        = (symbol, interval, end)
+                first[key] = min(start, first.get(key, start))
+
+        candles_by_window = {}
+        futures           = {}
+        pool              = self._executor()
+
+        for job in jobs:
+            series = []
+            for (symbol, interval, _, end), timeframes in plans[id(job)].items():
+                window = (symbol, interval, first[(symbol, interval, end)], end)
+                if window not in candles_by_window:
+                    try:
+                        candles_by_window[window] = np.asarray(self.store.candles(*window))
+                    except Exception as e:
+                        print(f"Candle fetch failed for {symbol} ({interval}): {e}")
+                        candles_by_window[window] = None
+                if candles_by_window[window] is not None:
+                    series.append((candles_by_window[window], timeframes))
+
+            if not series:
+                yield job["trade_id"], dict.fromkeys(job_timeframes(job))
+                continue
+            futures[pool.submit(_render_job, job, series)] = job
+
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                job = futures[future]
+                print(f"Chart worker error for trade {job['trade_id']}: {e}")
+                yield job["trade_id"], dict.fromkeys(job_timeframes(job))
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
@@ -1,28 +1,24 @@
-import pandas as pd
-import numpy as np
 from datetime import datetime
 
-def csv_handler(df_trade, df_fees=None):
-    df_trade["pnl"] = (
-        df_trade["pnl"]
-        .astype(str)
-        .str.replace("$", "", regex=False)
-        .str.replace("(", "-", regex=False)
-        .str.replace(")", "", regex=False)
-        .astype(float)
-    )
+# Rows per chunk when streaming a broker export
+CSV_CHUNK_ROWS = 50_000
+
+# Fill columns every broker adapter (utils.brokers) produces
+CSV_COLUMNS = [
+    "symbol", "buyFillId", "sellFillId",
+    "qty", "buyPrice", "sellPrice",
+    "pnl", "boughtTimestamp", "soldTimestamp", "duration",
+]
 
-    df_trade["boughtTimestamp"] = pd.to_datetime(df_trade["boughtTimestamp"], format="%m/%d/%Y %H:%M:%S")
-    df_trade["soldTimestamp"]   = pd.to_datetime(df_trade["soldTimestamp"],   format="%m/%d/%Y %H:%M:%S")
 
-    df_trade["symbol"] = df_trade["symbol"].str[:-2]
+def csv_handler(df_trade, df_fees=None):
+    """Apply fees to one typed chunk of fills (see utils.brokers) and format it for staging."""
+    df_trade = df_trade[CSV_COLUMNS].copy()
 
     # ===== FEES =====
     if df_fees is not None and not df_fees.empty:
-        df_fees["symbol"]  = df_fees["symbol"].str.upper()
-        df_trade["symbol"] = df_trade["symbol"].str.upper()
-        df_trade = df_trade.merge(df_fees, on="symbol", how="left")
-        df_trade["fees"] = df_trade["fees"].fillna(0) * df_trade["qty"]
+        fee_map = dict(zip(df_fees["symbol"].str.upper(), df_fees["fees"]))
+        df_trade["fees"] = df_trade["symbol"].map(fee_map).fillna(0).astype(float) * df_trade["qty"]
         df_trade["pnl"]  = df_trade["pnl"] - df_trade["fees"]
     else:
         df_trade["fees"] = 0
@@ -38,32 +34,21 @@ def csv_handler(df_trade, df_fees=None):
         "pnl", "fees", "boughtTimestamp", "soldTimestamp", "duration"
     ]]
 
-def filter_trades(trades, account_id=None, date_from=None, date_to=None, strategy_id=None, setup_ids=None):
-    result = []
-
-    from_dt = datetime.fromisoformat(date_from) if date_from else None
-    to_dt   = datetime.fromisoformat(date_to)   if date_to   else None
-    if to_dt:
-        to_dt = to_dt.replace(hour=23, minute=59, second=59)
-
-    setup_ids = set(map(int, setup_ids)) if setup_ids else set()
-
-    for t in trades:
-        if account_id and str(t.get("key_trading_accounts")) != str(account_id):
-            continue
-
-        entry_ts = datetime.fromisoformat(t["entryTimestamp"])
-        if from_dt and entry_ts < from_dt:
-            continue
-        if to_dt and entry_ts > to_dt:
-            continue
+def apply_trade_filters(query, date_from=None, date_to=None, strategy_id=None, trade_ids=None):
+    """Turn the /api/trades filters into predicates on a Supabase `trades` query."""
+    if date_from:
+        from_dt = datetime.fromisoformat(date_from)
+        query   = query.gte("entryTimestamp", from_dt.isoformat(sep=" "))
 
-        if strategy_id and str(t.get("key_strategies_id")) != str(strategy_id):
-            continue
+    if date_to:
+        to_dt = datetime.fromisoformat(date_to).replace(hour=23, minute=59, second=59)
+        query = query.lte("entryTimestamp", to_dt.isoformat(sep=" "))
 
-        if setup_ids and not setup_ids.intersection(set(t.get("setups", []))):
-            continue
+    if strategy_id:
+        query = query.eq("key_strategies_id", strategy_id)
 
-        result.append(t)
+    # result of the trade_setup semi-join
+    if trade_ids is not None:
+        query = query.in_("id", list(trade_ids))
 
-    return result
\ No newline at end of file
+    return query
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _legs(fills):
+    """Per-fill side, entry/exit time and entry/exit price (vectorised)."""
+    bought = pd.to_datetime(fills["boughtTimestamp"]).to_numpy()
+    sold   = pd.to_datetime(fills["soldTimestamp"]).to_numpy()
+    long   = bought < sold
+    return {
+        "long":        long,
+        "entry":       np.where(long, bought, sold),
+        "exit":        np.where(long, sold, bought),
+        "entry_price": np.where(long, fills["buyPrice"].to_numpy(float), fills["sellPrice"].to_numpy(float)),
+        "exit_price":  np.where(long, fills["sellPrice"].to_numpy(float), fills["buyPrice"].to_numpy(float)),
+    }
+
+
+def auto_group(fills):
+    """
+    Group round-trip fills into trades: per account and symbol, walk the
+    entries and exits in time order, track the open quantity and close the
+    trade whenever it returns to flat. Returns a group id per fill.
+
+    At equal timestamps exits are taken before entries, so a reversal or an
+    immediate re-entry starts a new trade; a fill opened and closed in the
+    same second exits after the entries of that second.
+    """
+    n = len(fills)
+    if not n:
+        return np.empty(0, dtype=np.int64)
+
+    legs    = _legs(fills)
+    qty     = fills["qty"].to_numpy(float)
+    book, _ = pd.factorize(pd.MultiIndex.from_arrays([
+        fills["key_trading_accounts"].astype(str), fills["symbol"].astype(str),
+    ]))
+    instant = legs["entry"] == legs["exit"]
+
+    # one entry (+qty) and one exit (-qty) event per fill
+    fill_idx = np.concatenate([np.arange(n), np.arange(n)])
+    is_entry = np.concatenate([np.ones(n, bool), np.zeros(n, bool)])
+    when     = np.concatenate([legs["entry"], legs["exit"]]).astype("datetime64[s]").astype(np.int64)
+    delta    = np.concatenate([qty, -qty])
+    rank     = np.concatenate([np.ones(n), np.where(instant, 2, 0)])   # exit, entry, same-second exit
+    books    = np.concatenate([book, book])
+
+    order    = np.lexsort((fill_idx, rank, when, books))
+    position = np.cumsum(delta[order])
+    before   = position - delta[order]
+
+    # a trade starts at every entry taken while its book is flat
+    starts   = is_entry[order] & np.isclose(before, 0)
+    trade_no = np.cumsum(starts) - 1
+
+    groups = np.empty(n, dtype=np.int64)
+    entry_events = is_entry[order]
+    groups[fill_idx[order][entry_events]] = trade_no[entry_events]
+    return groups
+
+
+def _format_duration(seconds):
+    secs  = pd.Series(seconds.astype(np.int64))
+    h, m, s = (secs // 3600).astype(str), (secs % 3600 // 60).astype(str), (secs % 60).astype(str)
+    return np.where(
+        secs >= 3600, h + "h " + m + "min " + s + "sec",
+        np.where(secs >= 60, m + "min " + s + "sec", s + "sec"),
+    )
+
+
+def trade_aggregates(fills, groups):
+    """
+    One row per group (groups < 0 are left out): side of its first fill,
+    summed qty / pnl / fees, first entry, last exit, qty-weighted entry and
+    exit prices and the holding duration, ordered by group id.
+    """
+    legs = _legs(fills)
+    qty  = fills["qty"].to_numpy(float)
+    frame = pd.DataFrame({
+        "group":                groups,
+        "symbol":               fills["symbol"].to_numpy(),
+        "key_trading_accounts": fills["key_trading_accounts"].to_numpy(),
+        "long":                 legs["long"],
+        "qty":                  fills["qty"].to_numpy(),
+        "pnl":                  fills["pnl"].to_numpy(float),
+        "fees":                 fills["fees"].to_numpy(float) if "fees" in fills else 0.0,
+        "entry":                legs["entry"],
+        "exit":                 legs["exit"],
+        "entry_value":          legs["entry_price"] * qty,
+        "exit_value":           legs["exit_price"] * qty,
+    })
+    frame = frame[frame["group"] >= 0]
+
+    agg = frame.groupby("group", sort=True).agg(
+        symbol=("symbol", "first"),
+        key_trading_accounts=("key_trading_accounts", "first"),
+        long=("long", "first"),
+        qty=("qty", "sum"),
+        pnl=("pnl", "sum"),
+        fees=("fees", "sum"),
+        entry=("entry", "min"),
+        exit=("exit", "max"),
+        entry_value=("entry_value", "sum"),
+        exit_value=("exit_value", "sum"),
+        fill_count=("qty", "size"),
+    )
+
+    pnl  = agg["pnl"].round(2)
+    fees = agg["fees"].round(2)
+    return pd.DataFrame({
+        "symbol":               agg["symbol"],
+        "entryTimestamp":       agg["entry"].dt.strftime(TS_FORMAT),
+        "exitTimestamp":        agg["exit"].dt.strftime(TS_FORMAT),
+        "entryPrice":           (agg["entry_value"] / agg["qty"]).round(4),
+        "exitPrice":            (agg["exit_value"] / agg["qty"]).round(4),
+        "qty":                  agg["qty"],
+        "pnl":                  pnl,
+        "gross_pnl":            (pnl + fees).round(2),
+        "fees":                 fees,
+        "duration":             _format_duration((agg["exit"] - agg["entry"]).dt.total_seconds().to_numpy()),
+        "side":                 np.where(agg["long"], "long", "short"),
+        "key_trading_accounts": agg["key_trading_accounts"],
+        "fill_count":           agg["fill_count"],
+    }, index=agg.index)
+
+
+def _id_strings(values):
+    # 123, 123.0 (a column with gaps) and "123" all compare as "123"
+    ids = pd.Series(values, dtype=object).reset_index(drop=True)
+    num = pd.to_numeric(ids, errors="coerce")
+    out = ids.astype(str)
+    whole = num.notna() & (num % 1 == 0)
+    out[whole] = num[whole].astype(np.int64).astype(str)
+    return out.to_numpy()
+
+
+def fill_keys(buy_ids, sell_ids):
+    """(buyFillId, sellFillId) pairs as an index for bulk membership tests."""
+    return pd.MultiIndex.from_arrays([_id_strings(buy_ids), _id_strings(sell_ids)])
+
+
+def fill_hashes(buy_ids, sell_ids):
+    """One 64-bit hash per (buyFillId, sellFillId) pair: a compact fill_keys for large key sets."""
+    return pd.util.hash_pandas_object(fill_keys(buy_ids, sell_ids), index=False).to_numpy()
+
+
+def duplicate_fills(fills, *known):
+    """
+    Mask of fills whose id pair is already in one of the `known` fill_hashes
+    arrays or repeats an earlier row of the frame. Fills without ids are
+    never dropped.
+    """
+    keys    = fill_keys(fills["buyFillId"], fills["sellFillId"])
+    hashes  = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    has_ids = (fills["buyFillId"].notna() & fills["sellFillId"].notna()).to_numpy()
+    seen    = np.zeros(len(keys), dtype=bool)
+    for hashes_known in known:
+        seen |= np.isin(hashes, hashes_known)
+    return has_ids & (seen | keys.duplicated())
@@ -0,0 +1,100 @@
+import io
+import os
+import uuid
+
+from PIL import Image
+
+# Encodings a chart variant can be served in
+IMAGE_FORMATS = {
+    "webp": "image/webp",
+    "png":  "image/png",    # palette-quantized
+}
+
+# Variant → maximum width in pixels (None keeps the rendered size)
+IMAGE_VARIANTS = {
+    "thumb": 400,
+    "full":  None,
+}
+
+
+def encode_image(png, variant, fmt="webp", quality=80):
+    """
+    Re-encode a rendered PNG as one of IMAGE_VARIANTS: scaled down to the
+    variant's width, then saved as lossy WebP or as a PNG with a reduced palette
+    (charts are mostly flat colours, so few of them are needed).
+    """
+    img   = Image.open(io.BytesIO(png)).convert("RGB")
+    width = IMAGE_VARIANTS[variant]
+    if width and img.width > width:
+        img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    elif fmt == "png":
+        img.quantize(colors=64 if width else 128).save(buf, format="PNG", optimize=True)
+    else:
+        raise ValueError(f"Unknown image format: {fmt}")
+    return buf.getvalue()
+
+
+class VariantStore:
+    """
+    Thumbnail and full-size encodings of the charts in a BlobStore.
+
+    A variant is derived from a blob's bytes alone, so like the blob it never
+    changes: it lives at <root>/<key[:2]>/<key>.<variant>.<fmt> and is
+    encoded once, either when the chart is rendered or on first request.
+    """
+
+    def __init__(self, blobs, root, fmt="webp", quality=80):
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {fmt}")
+        self.blobs    = blobs
+        self.root     = root
+        self.fmt      = fmt
+        self.quality  = quality
+        self.mimetype = IMAGE_FORMATS[fmt]
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key, variant):
+        return os.path.join(self.root, key[:2], f"{key}.{variant}.{self.fmt}")
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+
+    def etag(self, key, variant):
+        return f"{key}.{variant}.{self.fmt}"
+
+    def warm(self, key, png):
+        """Encode every variant of a freshly stored chart ahead of its first request."""
+        for variant in IMAGE_VARIANTS:
+            path = self._path(key, variant)
+            if not os.path.exists(path):
+                self._write(path, encode_image(png, variant, self.fmt, self.quality))
+
+    def get(self, key, variant):
+        """The variant's bytes (encoding it now if needed), or None for an unknown key or variant."""
+        if variant not in IMAGE_VARIANTS or not self.blobs.exists(key):
+            return None
+        path = self._path(key, variant)
+        try:
+            with open(path, "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            pass
+        data = encode_image(self.blobs.get(key), variant, self.fmt, self.quality)
+        self._write(path, data)
+        return data
+
+    def delete(self, key):
+        """Remove every encoding of a deleted blob."""
+        for variant in IMAGE_VARIANTS:
+            try:
+                os.remove(self._path(key, variant))
+            except FileNotFoundError:
+                pass
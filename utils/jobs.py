@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """Progress of one background job; every change is flushed to the queue's folder."""
+
+    def __init__(self, queue, job_id, owner, kind, total):
+        self.queue   = queue
+        self.id      = job_id
+        self.owner   = owner
+        self.kind    = kind
+        self.total   = total
+        self.status  = "queued"
+        self.done    = 0
+        self.updated = []
+        self.cached  = []
+        self.failed  = []
+        self.error   = None
+        self.created = time.time()
+        self._lock   = threading.Lock()
+
+    def snapshot(self):
+        return {
+            "id":      self.id,
+            "owner":   self.owner,
+            "kind":    self.kind,
+            "status":  self.status,
+            "total":   self.total,
+            "done":    self.done,
+            "updated": list(self.updated),
+            "cached":  list(self.cached),
+            "failed":  list(self.failed),
+            "error":   self.error,
+            "created": self.created,
+        }
+
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+        self.queue._save(self)
+
+    def advance(self, item_id, ok):
+        """Record one finished item (e.g. a trade whose chart was rendered)."""
+        with self._lock:
+            self.done += 1
+            (self.updated if ok else self.failed).append(item_id)
+        self.queue._save(self)
+
+    def skip(self, item_ids):
+        """Record items that needed no work (e.g. charts already up to date) in one go."""
+        with self._lock:
+            self.done += len(item_ids)
+            self.cached.extend(item_ids)
+        self.queue._save(self)
+
+    def _finish(self, status, error=None):
+        with self._lock:
+            self.status = status
+            self.error  = error
+        self.queue._save(self)
+
+
+class JobQueue:
+    """
+    Local background worker for long-running requests.
+
+    Jobs run on a small thread pool inside the web process; their state is
+    written as JSON under `root` so any web worker can answer progress polls.
+    Finished jobs are evicted after `ttl` seconds.
+    """
+
+    def __init__(self, root, workers=2, ttl=3600):
+        self.root     = root
+        self.ttl      = ttl
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def _save(self, job):
+        path = self._path(job.id)
+        tmp  = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump(job.snapshot(), fh)
+        os.replace(tmp, path)
+
+    def _run(self, job, fn, args, kwargs):
+        job._finish("running")
+        try:
+            fn(job, *args, **kwargs)
+            job._finish("done")
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed")
+            print(traceback.format_exc())
+            job._finish("failed", str(e))
+
+    def submit(self, owner, kind, total, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs) and return the job id immediately."""
+        self._evict()
+        job = Job(self, uuid.uuid4().hex, owner, kind, total)
+        self._save(job)
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def get(self, job_id):
+        if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import datetime
+
+# PostgREST's default max-rows; a page never asks for more than this
+PAGE_SIZE = 1000
+
+# Ids per `in.(...)` filter, keeps request URLs well under proxy limits
+IN_CHUNK = 200
+
+
+def chunked(values, size=IN_CHUNK):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def fetch_all(build, key="id", order=None, page_size=PAGE_SIZE):
+    """
+    Every row of a query, one page at a time.
+
+    `build()` must return a fresh query builder (select + filters). With a
+    unique `key` the pages are keyset-paginated on it; junction tables without
+    one pass key=None and an `order` tuple and are paginated by offset.
+    Stops on the first empty page, so a server-side max-rows lower than
+    page_size can never truncate the result.
+    """
+    rows   = []
+    last   = None
+    offset = 0
+    while True:
+        if key:
+            query = build().order(key).limit(page_size)
+            if last is not None:
+                query = query.gt(key, last)
+        else:
+            query = build()
+            for column in order:
+                query = query.order(column)
+            query = query.range(offset, offset + page_size - 1)
+
+        page = query.execute().data or []
+        if not page:
+            return rows
+        rows.extend(page)
+        last    = page[-1][key] if key else None
+        offset += len(page)
+
+
+def fetch_in(build, column, values, key="id", order=None):
+    """fetch_all over `column IN values`, with the IN list split into chunks."""
+    rows = []
+    for chunk in chunked(values):
+        rows.extend(fetch_all(lambda: build().in_(column, chunk), key=key, order=order))
+    return rows
+
+
+def fetch_page(build, limit, after=None, ts_column="entryTimestamp", key="id"):
+    """One page ordered by (ts_column, key), starting strictly after the `after` (ts, key) pair."""
+    query = build().order(ts_column).order(key).limit(min(limit, PAGE_SIZE))
+    if after:
+        ts, last_key = after
+        query = query.or_(f'{ts_column}.gt."{ts}",and({ts_column}.eq."{ts}",{key}.gt.{int(last_key)})')
+    return query.execute().data or []
+
+
+def encode_cursor(row, ts_column="entryTimestamp", key="id"):
+    raw = json.dumps([row[ts_column], row[key]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Opaque cursor → (ts, id); ValueError on anything malformed."""
+    try:
+        raw      = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, key  = json.loads(raw)
+        datetime.fromisoformat(ts)
+        return ts, int(key)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def insert_all(build, rows, size=PAGE_SIZE, key=None, into=None):
+    """
+    Insert rows with one request per `size` of them and return the inserted
+    rows (ids included). `build()` returns the table builder.
+
+    PostgREST does not promise to return a batch in the order it was sent:
+    with `key` (row → hashable identity, applied to sent and returned rows
+    alike) each batch is matched back into input order, and a batch that
+    cannot be matched raises ValueError. Rows land in `into` as their batch
+    succeeds, so a caller can still see what was written before a failure.
+    """
+    inserted = [] if into is None else into
+    for batch in chunked(rows, size):
+        returned = build().insert(batch).execute().data or []
+        if key is not None:
+            by_key = {}
+            for row in returned:
+                by_key.setdefault(key(row), []).append(row)
+            matched = []
+            for row in batch:
+                candidates = by_key.get(key(row))
+                matched.append(candidates.pop() if candidates else None)
+            if len(returned) != len(batch) or None in matched:
+                inserted.extend(returned)
+                raise ValueError("Inserted rows do not match the rows sent")
+            returned = matched
+        inserted.extend(returned)
+    return inserted
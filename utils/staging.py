@@ -0,0 +1,148 @@
+import os
+import pickle
+import re
+import shutil
+import time
+import uuid
+
+import pandas as pd
+
+
+class StagedUpload:
+    """An upload being written chunk by chunk; becomes visible on commit()."""
+
+    def __init__(self, store, owner, meta):
+        self.store = store
+        self.token = uuid.uuid4().hex
+        self.tmp   = os.path.join(store.root, f"{self.token}.{uuid.uuid4().hex}.tmp")
+        self.parts = 0
+        self.rows  = 0
+        self.sizes = []
+        os.makedirs(self.tmp)
+        self._dump("meta.pkl", {"owner": owner, "meta": meta})
+
+    def _dump(self, name, obj):
+        with open(os.path.join(self.tmp, name), "wb") as fh:
+            pickle.dump(obj, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def append(self, frame):
+        if frame.empty:
+            return
+        self._dump(f"part-{self.parts:05d}.pkl", frame)
+        self.parts += 1
+        self.rows  += len(frame)
+        self.sizes.append(len(frame))
+
+    def attach(self, name, obj):
+        """Stage a named object next to the fills (read back with StagingStore.attachment)."""
+        self._dump(f"{name}.att.pkl", obj)
+
+    def commit(self):
+        self._dump("sizes.pkl", self.sizes)
+        os.replace(self.tmp, self.store._path(self.token))
+        return self.token
+
+    def abort(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class StagingStore:
+    """
+    Parsed uploads waiting for confirmation, kept on local disk.
+
+    Each upload is a folder holding its owner, some metadata and the fills
+    as DataFrame chunks (columnar, so a large export stays compact and can be
+    written without ever holding the raw file in memory). The browser only
+    keeps the token; staged uploads older than `ttl` seconds are evicted.
+    """
+
+    def __init__(self, root, ttl=3600):
+        self.root = root
+        self.ttl  = ttl
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, token):
+        return os.path.join(self.root, token)
+
+    def open(self, owner, **meta):
+        """Start staging an upload for `owner`; append() chunks, then commit() for the token."""
+        self._evict()
+        return StagedUpload(self, owner, meta)
+
+    def _load(self, path, name):
+        with open(os.path.join(path, name), "rb") as fh:
+            return pickle.load(fh)
+
+    def _live(self, owner, token):
+        """Folder and meta of a live token staged by `owner`, else None."""
+        if not token or not re.fullmatch(r"[0-9a-f]{32}", token):
+            return None
+        path = self._path(token)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl:
+                return None
+            staged = self._load(path, "meta.pkl")
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        return (path, staged["meta"]) if staged["owner"] == owner else None
+
+    def get(self, owner, token):
+        """(frame, meta) for a live token staged by `owner`, else None."""
+        live = self._live(owner, token)
+        if live is None:
+            return None
+        path, meta = live
+        try:
+            frames = [self._load(path, name) for name in sorted(os.listdir(path)) if name.startswith("part-")]
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return frame, meta
+
+    def page(self, owner, token, offset, limit):
+        """
+        (rows offset..offset+limit as one frame, total rows) of a live upload,
+        else None; only the chunks overlapping the page are read.
+        """
+        live = self._live(owner, token)
+        if live is None:
+            return None
+        path = live[0]
+        try:
+            sizes  = self._load(path, "sizes.pkl")
+            frames = []
+            start  = 0
+            for part, size in enumerate(sizes):
+                end = start + size
+                if end > offset and start < offset + limit:
+                    frame = self._load(path, f"part-{part:05d}.pkl")
+                    frames.append(frame.iloc[max(offset - start, 0):offset + limit - start])
+                start = end
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return frame, sum(sizes)
+
+    def attachment(self, owner, token, name, default=None):
+        """An object staged with StagedUpload.attach, or `default`."""
+        live = self._live(owner, token)
+        if live is None:
+            return default
+        try:
+            return self._load(live[0], f"{name}.att.pkl")
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return default
+
+    def discard(self, token):
+        if token and re.fullmatch(r"[0-9a-f]{32}", token):
+            shutil.rmtree(self._path(token), ignore_errors=True)
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+from collections import defaultdict
+
+
+def _day(ts):
+    # entryTimestamp is "YYYY-MM-DD HH:MM:SS" or ISO string
+    return str(ts)[:10]
+
+
+def trade_deltas(trades, sign=1):
+    """
+    (account_id, day) → [trades, pnl] contributions of some trade rows
+    (key_trading_accounts, entryTimestamp, pnl); sign=-1 takes them back out.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for t in trades:
+        key = (int(t["key_trading_accounts"]), _day(t["entryTimestamp"]))
+        deltas[key][0] += sign
+        deltas[key][1] += sign * float(t.get("pnl") or 0)
+    return deltas
+
+
+class DailySummary:
+    """
+    Per-account daily P&L, materialised in a local SQLite file.
+
+    An account is built from its trades the first time it is read and from
+    then on kept current by applying deltas wherever trades are inserted,
+    re-priced or deleted. Deltas for accounts that were never built are
+    dropped: the next read builds them from the database anyway.
+
+    Builds and deltas race with the database writes they mirror, so every
+    account carries a version that both bump. A writer takes snapshot()
+    before touching the database and hands it to apply(): if the account
+    was built or changed in between, its deltas may already be counted and
+    the account is dropped for a rebuild instead. A build whose account
+    changed while its trades were loading is discarded the same way.
+
+    The file is per host: processes sharing SUMMARY_DB stay consistent with
+    each other, but a write served by another host never reaches it. Put
+    SUMMARY_DB on storage every worker shares, or run a single host.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS daily_pnl (
+                    account_id INTEGER NOT NULL,
+                    day        TEXT    NOT NULL,
+                    trades     INTEGER NOT NULL,
+                    pnl        REAL    NOT NULL,
+                    PRIMARY KEY (account_id, day)
+                )
+            """)
+            db.execute("CREATE TABLE IF NOT EXISTS built_accounts (account_id INTEGER PRIMARY KEY)")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS account_versions (
+                    account_id INTEGER PRIMARY KEY,
+                    version    INTEGER NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _bump(self, db, account_ids):
+        db.executemany("""
+            INSERT INTO account_versions VALUES (?, 1)
+            ON CONFLICT (account_id) DO UPDATE SET version = version + 1
+        """, [(a,) for a in account_ids])
+
+    def _forget(self, db, account_ids):
+        for account_id in account_ids:
+            db.execute("DELETE FROM daily_pnl WHERE account_id = ?", (account_id,))
+            db.execute("DELETE FROM built_accounts WHERE account_id = ?", (account_id,))
+
+    def snapshot(self):
+        """account_id → version, to be taken before a write and passed to apply()."""
+        with self._connect() as db:
+            return dict(db.execute("SELECT account_id, version FROM account_versions"))
+
+    def ensure(self, account_ids, load):
+        """Build every account not materialised yet; load(account_id) returns its trades."""
+        with self._connect() as db:
+            built = {r[0] for r in db.execute("SELECT account_id FROM built_accounts")}
+        missing = {int(a) for a in account_ids} - built
+        if not missing:
+            return
+        since = self.snapshot()
+        for account_id in missing:
+            self.build(account_id, load(account_id), since.get(account_id, 0))
+
+    def build(self, account_id, trades, version):
+        """
+        Materialise an account from trades loaded at `version`; a no-op
+        (returning False) when a write bumped the account in the meantime.
+        """
+        rows = [
+            (account_id, day, n, pnl)
+            for (_, day), (n, pnl) in trade_deltas(trades).items()
+        ]
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            current = db.execute(
+                "SELECT version FROM account_versions WHERE account_id = ?", (account_id,)
+            ).fetchone()
+            if (current[0] if current else 0) != version:
+                return False
+            db.execute("DELETE FROM daily_pnl WHERE account_id = ?", (account_id,))
+            db.executemany("INSERT INTO daily_pnl VALUES (?, ?, ?, ?)", rows)
+            db.execute("INSERT OR IGNORE INTO built_accounts VALUES (?)", (account_id,))
+            self._bump(db, [account_id])
+        return True
+
+    def apply(self, deltas, since):
+        """
+        Add trade_deltas() output to the accounts that are materialised.
+        Accounts whose version moved since the `since` snapshot are dropped
+        instead, to be rebuilt on their next read.
+        """
+        if not deltas:
+            return
+        accounts = {account_id for account_id, _ in deltas}
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            built   = {r[0] for r in db.execute("SELECT account_id FROM built_accounts")}
+            current = dict(db.execute("SELECT account_id, version FROM account_versions"))
+            moved   = {a for a in accounts & built if current.get(a, 0) != since.get(a, 0)}
+            self._forget(db, moved)
+            rows = [
+                (account_id, day, n, pnl)
+                for (account_id, day), (n, pnl) in deltas.items()
+                if account_id in built - moved
+            ]
+            db.executemany("""
+                INSERT INTO daily_pnl VALUES (?, ?, ?, ?)
+                ON CONFLICT (account_id, day) DO UPDATE SET
+                    trades = trades + excluded.trades,
+                    pnl    = pnl    + excluded.pnl
+            """, rows)
+            db.execute("DELETE FROM daily_pnl WHERE trades <= 0")
+            self._bump(db, accounts)
+
+    def replace(self, before, after, since):
+        """Swap the old contribution of some edited trades for their new one."""
+        deltas = trade_deltas(before, -1)
+        for key, (n, pnl) in trade_deltas(after).items():
+            deltas[key][0] += n
+            deltas[key][1] += pnl
+        self.apply(deltas, since)
+
+    def drop(self, account_id):
+        """Forget an account entirely; it is rebuilt on its next read."""
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._forget(db, [int(account_id)])
+            self._bump(db, [int(account_id)])
+
+    def days(self, account_ids, date_from=None, date_to=None):
+        """[{date, trades, pnl}] summed over account_ids for date_from <= day < date_to."""
+        account_ids = [int(a) for a in account_ids]
+        if not account_ids:
+            return []
+        sql    = f"SELECT day, SUM(trades), SUM(pnl) FROM daily_pnl WHERE account_id IN ({','.join('?' * len(account_ids))})"
+        params = list(account_ids)
+        if date_from:
+            sql += " AND day >= ?"
+            params.append(date_from)
+        if date_to:
+            sql += " AND day < ?"
+            params.append(date_to)
+        sql += " GROUP BY day ORDER BY day"
+        with self._connect() as db:
+            return [
+                {"date": day, "trades": n, "pnl": round(pnl, 2)}
+                for day, n, pnl in db.execute(sql, params)
+            ]
@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+YAHOO_CHART_URL = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}"
+
+YAHOO_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept":     "application/json",
+    "Referer":    "https://finance.yahoo.com",
+}
+
+# Sustained requests per second to Yahoo, and how many may go out back to back
+YAHOO_RATE  = 4
+YAHOO_BURST = 8
+
+
+class YahooError(Exception):
+    """Raised when Yahoo answers with an HTTP error or an empty chart result."""
+
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body   = body
+
+
+def yahoo_symbol(symbol):
+    """Futures root ("ES") → Yahoo continuous contract ("ES=F")."""
+    return symbol if symbol.endswith("=F") else f"{symbol}=F"
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, at most `burst` saved up."""
+
+    def __init__(self, rate, burst):
+        self.rate   = float(rate)
+        self.burst  = float(burst)
+        self.tokens = float(burst)
+        self.stamp  = time.monotonic()
+        self._lock  = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now         = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp  = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class YahooClient:
+    """
+    The app's only way to Yahoo: one keep-alive connection pool, a token
+    bucket so bulk chart runs stay under Yahoo's throttling, and
+    single-flight requests, so concurrent callers asking for the same
+    (symbol, interval, window) share one fetch and its result.
+    """
+
+    def __init__(self, rate=YAHOO_RATE, burst=YAHOO_BURST, pool_size=16, timeout=10):
+        self.timeout = timeout
+        self.bucket  = TokenBucket(rate, burst)
+        self.session = requests.Session()
+        self.session.headers.update(YAHOO_HEADERS)
+        adapter = HTTPAdapter(
+            pool_connections = 1,
+            pool_maxsize     = pool_size,
+            max_retries      = Retry(
+                total            = 2,
+                backoff_factor   = 0.5,
+                status_forcelist = (429, 502, 503, 504),
+                allowed_methods  = ("GET",),
+                raise_on_status  = False,   # the last response still becomes a YahooError
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self._inflight = {}
+        self._lock     = threading.Lock()
+
+    def _get(self, symbol, params):
+        self.bucket.acquire()
+        r = self.session.get(YAHOO_CHART_URL.format(symbol=symbol), params=params, timeout=self.timeout)
+        if not r.ok:
+            raise YahooError(f"Yahoo returned {r.status_code} for {symbol}", status=r.status_code, body=r.text[:500])
+        return r.json()
+
+    def fetch_chart(self, symbol, interval, period1=None, period2=None, range_param=None):
+        """Raw Yahoo chart JSON for an absolute window (period1/period2) or a relative range."""
+        params = {"interval": interval}
+        if period1 is not None:
+            params["period1"] = int(period1)
+            params["period2"] = int(period2)
+        else:
+            params["range"] = range_param or "1d"
+
+        key = (symbol, *sorted(params.items()))
+        with self._lock:
+            call   = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = Future()
+
+        if leader:
+            try:
+                call.set_result(self._get(symbol, params))
+            except Exception as e:
+                call.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+        return call.result()
+
+
+client = YahooClient()
+
+
+def fetch_chart(symbol, interval, period1=None, period2=None, range_param=None):
+    """Module-level shortcut to the shared client's fetch_chart."""
+    return client.fetch_chart(symbol, interval, period1, period2, range_param)
+
+
+def chart_result(data):
+    """First `chart.result` entry of a Yahoo payload, or YahooError."""
+    result = data.get("chart", {}).get("result")
+    if not result:
+        raise YahooError(f"No result in Yahoo response: {data.get('chart', {}).get('error')}")
+    return result[0]